@@ -34,7 +34,7 @@ class IAccessible2Atta(Atta):
 
         super(IAccessible2Atta, self).__init__(host, port, name, version, api, Atta.LOG_INFO)
 
-get_cmdline_options()
+options = get_cmdline_options()
 # Function moved to win_atta_base
 
 if __name__ == "__main__":
@@ -43,7 +43,9 @@ if __name__ == "__main__":
     if not ia2_atta.is_enabled():
         print("ia2_atta is not enabled.")
         sys.exit(1)
-    ia2_atta.start(ia2_atta)
+    ia2_atta.start(ia2_atta, pretty_json=options.get("pretty_json"), log_verbosity=options.get("log_verbosity"),
+                   results_file=options.get("results_file"), workers=options.get("workers"),
+                   manifest=options.get("manifest"), full_walk=options.get("full_walk"))
     pyia2.Registry.start()
     print("Shutting down...")
     ia2_atta.shutdown(ia2_atta, signal.SIGTERM)
@@ -34,7 +34,7 @@ class IAccessibleAtta(Atta):
 
         super(IAccessibleAtta, self).__init__(host, port, name, version, api, Atta.LOG_INFO)
 
-get_cmdline_options()
+options = get_cmdline_options()
 # Function moved to win_atta_base
 
 if __name__ == "__main__":
@@ -43,7 +43,9 @@ if __name__ == "__main__":
     if not ia_atta.is_enabled():
         print("ia_atta is not enabled.")
         sys.exit(1)
-    ia_atta.start(ia_atta)
+    ia_atta.start(ia_atta, pretty_json=options.get("pretty_json"), log_verbosity=options.get("log_verbosity"),
+                  results_file=options.get("results_file"), workers=options.get("workers"),
+                  manifest=options.get("manifest"), full_walk=options.get("full_walk"))
     pyia2.Registry.start()
     print("Shutting down...")
     ia_atta.shutdown(ia_atta, signal.SIGTERM)
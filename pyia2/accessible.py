@@ -36,22 +36,32 @@ IAccessible2 = GetModule('ia2.tlb')
 from comtypes.automation import VARIANT, VT_I4, VT_DISPATCH
 from ctypes import c_long, oledll, byref, create_unicode_buffer
 from comtypes.gen.Accessibility   import IAccessible
-from comtypes.gen.IAccessible2Lib import IAccessible2
+from comtypes.gen.IAccessible2Lib import IAccessible2, \
+    IAccessibleRelation, \
+    IAccessibleText, \
+    IAccessibleValue, \
+    IAccessibleTable2, \
+    IAccessibleTableCell, \
+    IAccessibleHypertext2, \
+    IAccessibleImage, \
+    IAccessibleDocument
 from comtypes import named_property, COMError, hresult
-from constants import CHILDID_SELF, \
-    UNLOCALIZED_ROLE_NAMES, \
-    UNLOCALIZED_STATE_NAMES
+from constants import CHILDID_SELF
+from stats import counters
+from states import decode_state_bits
+from roles import role_name
 
 
 def _makeExceptionHandler(func):
     '''
     Builds a function calling the one it wraps in try/except statements catching
-    COMError exceptions.
+    COMError exceptions. Each call is counted as a COM call.
 
     @return: Function calling the method being wrapped
     @rtype: function
     '''
     def _inner(self, *args, **kwargs):
+        counters.increment('com_calls')
         try:
             return func(self, *args, **kwargs)
         except COMError, e:
@@ -210,15 +220,7 @@ class _IAccessibleMixin(object):
         return self.accChildCount
 
     def accStateSet(self, child_id=CHILDID_SELF):
-        states = []
-        state = self.accState(child_id)
-        for shift in xrange(64):
-            state_bit = 1 << shift
-            if state_bit & state:
-                states.append(
-                    UNLOCALIZED_STATE_NAMES.get(
-                        (state_bit & state), 'unknown'))
-        return states
+        return list(decode_state_bits(self.accState(child_id)))
 
     def accLocalizedStateSet(self, child_id=CHILDID_SELF):
         states = []
@@ -243,7 +245,7 @@ class _IAccessibleMixin(object):
         if not isinstance(role, int):
             # Maybe one of those Mozilla string roles, just return it.
             return role
-        return UNLOCALIZED_ROLE_NAMES.get(role, 'unknown')
+        return role_name(role)
 
     def accLocalizedRoleName(self, child_id=CHILDID_SELF):
         role = self.accRole(child_id)
@@ -305,3 +307,9 @@ class ManagedChildAccessible(object):
 
 _mixExceptions(IAccessible)
 _mixClass(IAccessible, _IAccessibleMixin)
+
+for _iface in (IAccessible2, IAccessibleRelation, IAccessibleText,
+               IAccessibleValue, IAccessibleTable2, IAccessibleTableCell,
+               IAccessibleHypertext2, IAccessibleImage, IAccessibleDocument):
+    _mixExceptions(_iface)
+del _iface
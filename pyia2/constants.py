@@ -26,6 +26,9 @@ Boston, MA 02111-1307, USA.
 # Child ID.
 CHILDID_SELF = 0
 
+# Object ID of the client area of a window
+OBJID_CLIENT = -4
+
 # IAccessibleText Constants
 IA2_TEXT_OFFSET_LENGTH = -1
 IA2_TEXT_OFFSET_CARET  = -2
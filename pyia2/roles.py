@@ -0,0 +1,56 @@
+'''
+Translation of MSAA and IA2 role ids into unlocalized role names, through
+tables indexed by role id built once from the names in constants.
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Library General Public
+License as published by the Free Software Foundation; either
+version 2 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Library General Public License for more details.
+
+You should have received a copy of the GNU Library General Public
+License along with this library; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+'''
+
+from constants import UNLOCALIZED_ROLE_NAMES, \
+    UNLOCALIZED_IA2_ROLE_NAMES
+
+def _role_table(*names_list):
+    '''
+    Returns a tuple holding at each role id its name in the last of names_list
+    defining it, and 'unknown' for ids none of them define.
+    '''
+    table = ['unknown'] * (max(max(names) for names in names_list) + 1)
+    for names in names_list:
+        for role, name in names.items():
+            table[role] = name
+    return tuple(table)
+
+_role_names = _role_table(UNLOCALIZED_ROLE_NAMES)
+
+# IAccessible2::role returns the MSAA role when there is no IA2 specific one,
+# so the MSAA names fill the low ids; 0 stays IA2_ROLE_UNKNOWN.
+_ia2_role_names = _role_table(UNLOCALIZED_IA2_ROLE_NAMES,
+                              dict((role, name) for role, name in UNLOCALIZED_ROLE_NAMES.items() if role))
+
+def role_name(role):
+    '''
+    Returns the name of an MSAA role, or 'unknown'.
+    '''
+    if 0 <= role < len(_role_names):
+        return _role_names[role]
+    return 'unknown'
+
+def ia2_role_name(role):
+    '''
+    Returns the name of a role returned by IAccessible2::role, or 'unknown'.
+    '''
+    if 0 <= role < len(_ia2_role_names):
+        return _ia2_role_names[role]
+    return 'unknown'
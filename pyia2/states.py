@@ -0,0 +1,63 @@
+'''
+Decoding of MSAA and IA2 state bitmasks into state names. Decoded names are
+memoized by mask, since most accessibles share a handful of distinct masks.
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Library General Public
+License as published by the Free Software Foundation; either
+version 2 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Library General Public License for more details.
+
+You should have received a copy of the GNU Library General Public
+License along with this library; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+'''
+
+from constants import UNLOCALIZED_STATE_NAMES, \
+    UNLOCALIZED_IA2_STATE_NAMES
+from stats import counters
+
+class StateDecoder(object):
+    '''
+    Maps a state mask to the tuple of its names, calling decode(mask) only the
+    first time a mask is seen.
+    '''
+    def __init__(self, decode, max_size=4096):
+        self._decode = decode
+        self._max_size = max_size
+        self._cache = {}
+
+    def __call__(self, mask):
+        names = self._cache.get(mask)
+        if names is None:
+            counters.increment('state_decode_misses')
+            if len(self._cache) >= self._max_size:
+                self._cache = {}
+            names = self._cache[mask] = tuple(self._decode(mask))
+        return names
+
+def _names_in_mask(names):
+    '''
+    Returns decode(mask) listing the names whose value shares a bit with mask,
+    in the order names is iterated.
+    '''
+    items = names.items()
+    return lambda mask: [name for value, name in items if value & mask]
+
+def _bits_in_mask(names, size=64):
+    '''
+    Returns decode(mask) listing the name of each bit set in mask, lowest
+    first, or 'unknown' for bits without a name.
+    '''
+    return lambda mask: [names.get(1 << shift, 'unknown')
+                         for shift in xrange(size) if (1 << shift) & mask]
+
+# Create singleton decoders.
+decode_states = StateDecoder(_names_in_mask(UNLOCALIZED_STATE_NAMES))
+decode_ia2_states = StateDecoder(_names_in_mask(UNLOCALIZED_IA2_STATE_NAMES))
+decode_state_bits = StateDecoder(_bits_in_mask(UNLOCALIZED_STATE_NAMES))
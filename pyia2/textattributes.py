@@ -0,0 +1,113 @@
+'''
+Text attribute runs of IAccessibleText objects, walked once and kept as
+offset indexed arrays so the attributes at any offset can be answered
+without asking the server again until the text changes.
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Library General Public
+License as published by the Free Software Foundation; either
+version 2 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Library General Public License for more details.
+
+You should have received a copy of the GNU Library General Public
+License along with this library; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+'''
+
+import bisect
+import threading
+
+from array import array
+
+from stats import counters
+
+class TextAttributeRuns(object):
+    '''
+    The attribute runs of a text: run i covers offsets starts[i] up to
+    ends[i] and has the attribute string values[i].
+    '''
+    def __init__(self, length=0):
+        self.length = length
+        self.starts = array('i')
+        self.ends = array('i')
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    @classmethod
+    def walk(cls, text):
+        '''
+        Returns the runs of an IAccessibleText, asking for the attributes at
+        the end of each run to get the next one, so a text costs one call per
+        run plus one for its length.
+        '''
+        runs = cls(text.nCharacters)
+        offset = 0
+        while True:
+            start, end, attrs = text.attributes(offset)
+            counters.increment('text_attribute_runs')
+            runs.starts.append(start)
+            runs.ends.append(end)
+            runs.values.append(attrs)
+            # A server returning an empty run would otherwise be asked forever
+            if end <= offset or end >= runs.length:
+                break
+            offset = end
+        return runs
+
+    def getAttributes(self, offset):
+        '''
+        Returns (start, end, attributes) of the run covering offset, or None
+        if no run covers it. Special offsets such as IA2_TEXT_OFFSET_LENGTH
+        are left to the server, so they are never covered.
+        '''
+        if offset < 0:
+            return None
+
+        index = bisect.bisect_right(self.starts, offset) - 1
+        if index < 0 or offset >= self.ends[index]:
+            return None
+        return self.starts[index], self.ends[index], self.values[index]
+
+    def getAttributeSet(self, offset):
+        '''
+        Returns the attributes at offset as a list of 'name:value' strings.
+        '''
+        run = self.getAttributes(offset)
+        if run is not None:
+            attrs = run[2]
+            if attrs and len(attrs) and attrs[-1] == ';':
+                return attrs[:-1].split(';')
+        return []
+
+class TextAttributeCache(object):
+    '''
+    TextAttributeRuns by IA2 uniqueID, dropped when a text change event
+    comes from their object.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs = {}
+
+    def get(self, unique_id):
+        return self._runs.get(unique_id)
+
+    def add(self, unique_id, runs):
+        with self._lock:
+            self._runs[unique_id] = runs
+
+    def invalidate(self, unique_id=None):
+        '''
+        Drops the runs of unique_id, or all runs if it is None.
+        '''
+        with self._lock:
+            if unique_id is None:
+                self._runs = {}
+            else:
+                self._runs.pop(unique_id, None)
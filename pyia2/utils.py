@@ -33,6 +33,7 @@ import traceback
 import constants
 
 import collections
+import itertools
 
 import ctypes
 from ctypes import windll, oledll, POINTER, byref, c_int
@@ -41,10 +42,11 @@ from comtypes import CoInitializeEx
 from comtypes import CoUninitialize
 from comtypes import COINIT_MULTITHREADED
 from comtypes.gen.Accessibility import IAccessible
-from comtypes import COMError, IServiceProvider
+from comtypes import COMError, IServiceProvider, IUnknown
 from comtypes.client import GetModule, CreateObject
 import comtypesClient
 from constants import CHILDID_SELF, \
+    OBJID_CLIENT, \
     UNLOCALIZED_ROLE_NAMES, \
     UNLOCALIZED_STATE_NAMES, \
     UNLOCALIZED_IA2_STATE_NAMES, \
@@ -52,6 +54,12 @@ from constants import CHILDID_SELF, \
     UNLOCALIZED_IA2_RELATION_TYPES, \
     UNLOCALIZED_EVENT_NAMES, \
     IA2_TEXT_OFFSET_LENGTH
+from stats import counters
+from states import decode_states, decode_ia2_states
+from roles import ia2_role_name
+from textattributes import TextAttributeRuns, TextAttributeCache
+from walk import WALK_DESCEND, WALK_SKIP, WALK_STOP, \
+    getChildren, walkDescendants, findDescendant, findAllDescendants
 
 # IA2Lib = ctypes.WinDLL('C:\Program Files (x86)\NVDA\lib64\IAccessible2Proxy.dll')
 IA2Lib = comtypesClient.GetModule('ia2.tlb')
@@ -59,7 +67,9 @@ IALib  = comtypesClient.GetModule('oleacc.dll').IAccessible
 
 class AccessibleElement:
 
+  ao                    = None
   test_id               = ''
+  unique_id             = None
   role                  = ''
   ia2_role              = ''
   localizedExtendedRole = ''
@@ -71,7 +81,7 @@ class AccessibleElement:
   objectAttributes      = []
   textAttributes        = []
   relations             = []
-  interfaces            = []
+  ia2_relations         = []
   accKeyboardShortcut   = ''
   groupPosition         = ''
   columnExtent          = ''
@@ -83,29 +93,123 @@ class AccessibleElement:
   ia2_value_max         = '0'
 
 
-  def __init__(self, ao):
-    self.test_id               = get_id(ao)
+  def __init__(self, ao, fields=None):
+    '''
+    Collects the identity and role of ao and the given fields (see
+    ELEMENT_FIELDS), all of them if fields is None. Other fields are fetched
+    by load().
+    '''
+    self.ao                    = ao
+    self._interfaces           = {}
+    self._locator              = None
+    # Elements without id or role are never loaded
+    self._loaded               = None
+    # The getters below take the IAccessible2 as is instead of asking for it
+    pacc2                      = self.queryInterface('IAccessible2') or ao
+    self.test_id               = get_id(pacc2)
     if len(self.test_id) == 0:
         return
-    self.role                  = get_role(ao)
+    role_info                  = get_role_info(pacc2)
+    self.role                  = role_info.role
     if len(self.role) == 0:
         return
-    self.ia2_role              = get_ia2_role(ao)
-    self.localizedExtendedRole = get_extended_role(ao)
-    self.accName               = get_name(ao)
-    self.accValue              = get_value(ao)
-    self.ia2_value             = get_ia2_value(ao)
-    self.accDescription        = get_description(ao)
-    self.states                = get_state_set(ao)
-    self.objectAttributes      = get_ia2_attribute_set(ao)
-    self.textAttributes        = get_ia2_text_attribute_set(ao)
-    self.relations             = get_ia2_relation_set(ao)
-    self.interfaces            = get_interface_set(ao)
-    self.accKeyboardShortcut   = get_keyboard_shortcut(ao)
-    self.groupPosition         = get_ia2_group_position(ao)
-    self.columnExtent          = get_column_extent(ao)
-    self.rowExtent             = get_row_extent(ao)
-
+    self.unique_id             = get_unique_id(pacc2)
+    self.ia2_role              = role_info.ia2_role
+    self.localizedExtendedRole = role_info.localizedExtendedRole
+    self._loaded               = set()
+    self.load(fields)
+
+  def load(self, fields=None, interfaces=()):
+    '''
+    Fetches the given fields, or all of them, skipping those already fetched.
+    The given interfaces, e.g. those of a fetch plan, are asked for first,
+    then those the fields need that are not among them, each through
+    queryInterface() once, and every loader is given its interface.
+    '''
+    groups = self.getFieldGroups(fields, interfaces)
+    if not groups:
+      return
+
+    for name in interfaces:
+      self.queryInterface(name)
+
+    for name, fields in groups:
+      pacc = self.queryInterface(name)
+      if pacc is None and name == 'IAccessible2':
+        pacc = self.ao
+      for field, value in _load_fields(pacc, fields):
+        self._store(field, value)
+
+  def getFieldGroups(self, fields=None, interfaces=(), portable=False):
+    '''
+    Returns the given fields, or all of them, that are not fetched yet as a
+    list of (interface name, fields) pairs, one for each interface they need.
+    Fields needing no interface are grouped with those of IAccessible2. The
+    given interfaces come first, in order, then the others as they appear in
+    _element_loaders. With portable, fields whose values are only valid in
+    the COM apartment fetching them (APARTMENT_FIELDS) are left out.
+    '''
+    if self._loaded is None:
+      return []
+
+    if fields is None:
+      wanted = ELEMENT_FIELDS
+    else:
+      wanted = set(_element_field_sources.get(field, field) for field in fields) & ELEMENT_FIELDS
+    wanted = wanted - self._loaded
+    if portable:
+      wanted = wanted - APARTMENT_FIELDS
+
+    groups = collections.OrderedDict((name, []) for name in interfaces)
+    for field, (interface, loader, missing) in _element_loaders.items():
+      if field in wanted:
+        groups.setdefault(interface or 'IAccessible2', []).append(field)
+    return [(name, fields) for name, fields in groups.items() if fields]
+
+  def storeFields(self, values):
+    '''
+    Keeps the (field, value) pairs fetched elsewhere, e.g. by
+    fetchElementFields() on another thread, unless already fetched.
+    '''
+    if self._loaded is None:
+      return
+
+    for field, value in values:
+      if field not in self._loaded:
+        self._store(field, value)
+
+  def getLocator(self):
+    '''
+    Returns the (window handle, uniqueID) pair with which
+    accessibleObjectFromUniqueId() finds this element again on any thread,
+    or None if it has no IAccessible2.
+    '''
+    if self._locator is None:
+      self._locator = False
+      pacc2 = self.queryInterface('IAccessible2')
+      if pacc2 is not None and self.unique_id is not None:
+        try:
+          self._locator = (pacc2.windowHandle, self.unique_id)
+        except Exception as e:
+          print "[getLocator] Exception cannot get IA2 window handle:", str(e)
+    return self._locator or None
+
+  def _store(self, field, value):
+    setattr(self, field, value)
+    if field == 'ia2_relations':
+      self.relations = [relation.type for relation in self.ia2_relations]
+    elif field == 'ia2_value':
+      self._setValueFields()
+    self._loaded.add(field)
+
+  def unload(self, fields):
+    '''
+    Forgets the given fields, so the next load() fetches them again.
+    '''
+    if self._loaded is not None:
+      self._loaded.difference_update(_element_field_sources.get(field, field) for field in fields)
+
+  def _setValueFields(self):
     if self.ia2_value:
       self.ia2_value_min     = str(self.ia2_value[0])
       self.ia2_value_current = str(self.ia2_value[1])
@@ -121,9 +225,25 @@ class AccessibleElement:
       if self.ia2_value_max.find(".0") >= 0:
         self.ia2_value_max = self.ia2_value_max[:-2]
 
+  def queryInterface(self, name):
+    '''
+    Returns the interface called name (e.g. IAccessibleText) of this element,
+    or None if it has none, asking the server only the first time.
+    '''
+    try:
+      pacc2 = self._interfaces[name]
+      counters.increment('interface_probes_saved')
+    except KeyError:
+      counters.increment('interface_probes')
+      pacc2 = self._interfaces[name] = query_interface(self.ao, name)
+    return pacc2
+
+  def getInterfaces(self):
+    return [name for name in INTERFACE_NAMES if self.queryInterface(name) is not None]
 
   def __str__(self):
 
+    self.load()
     s = ''
 
     if self.test_id:
@@ -160,7 +280,7 @@ class AccessibleElement:
     s += "     ATTRIBUTES: " + str(self.objectAttributes) + "\n"
     s += "TEXT ATTRIBUTES: " + str(self.textAttributes) + "\n"
     s += "      RELATIONS: " + str(self.relations) + "\n"
-    s += "     INTERFACES: " + str(self.interfaces) + "\n"
+    s += "     INTERFACES: " + str(self.getInterfaces()) + "\n"
 
     if self.groupPosition:
         s += " GROUP POSITION: " + str(self.groupPosition) + "\n"
@@ -174,15 +294,39 @@ class AccessibleElement:
     return s
 
 
+# Generations are unique across documents so a reloaded URI never reuses one
+_generations = itertools.count(1)
+
+# Ids of the elements the WPT harness adds to test documents
+HARNESS_IDS = frozenset(['manualMode', 'log', 'ATTAmessages'])
+
 class AccessibleDocument:
 
-  def __init__(self, ao):
+  def __init__(self, ao, fields=(), target_fields=None, targeted=True):
     self.ao = ao
+    # Fields of ELEMENT_FIELDS test elements fetch when collected, the others
+    # are fetched by AccessibleElement.load() when first needed
+    self.fields = fields
+    # Fields to fetch for particular test elements, by id
+    self.target_fields = {}
+    # With targeted, only the elements with the ids of target_fields are
+    # searched for, and others only once asked for by getElementById
+    self.wanted_ids = set(target_fields) if target_fields and targeted else None
+    self.missing_ids = set()
+    # Nodes in the document as of its last full walk
+    self.node_count = None
+    self.walk_stats = {}
     self.busy = False
     self.events = []
     self.test_elements = []
+    self.elements_by_id = {}
+    self.ids_by_unique_id = {}
+    self.generation = next(_generations)
+    self.text_attributes = TextAttributeCache()
     self.document = AccessibleElement(ao)
     self.uri = get_value(ao)
+    if target_fields:
+      self.setTargetFields(target_fields)
     self.updateTestElements()
 
   def __str__(self):
@@ -208,16 +352,147 @@ class AccessibleDocument:
 
     return False
 
-  def updateTestElements(self):
-    self.test_elements = []
+  def invalidate(self):
+    '''
+    Starts a new generation, telling callers that cached information about
+    this document may be stale.
+    '''
+    self.generation = next(_generations)
+
+  def updateTestElements(self, ids=None):
+    '''
+    Collects the test elements with the given ids, or else with wanted_ids,
+    stopping as soon as all are found. When both are None, walks the whole
+    document and collects every element with an id.
+    '''
+    test_elements = []
+    elements_by_id = {}
+    ids_by_unique_id = {}
+    counters.increment('tree_walks')
+
+    if ids is None:
+      ids = self.wanted_ids
+
+    stats = {}
+    if ids is None:
+      found = findTestElements(self.ao, stats=stats)
+      self.node_count = stats['visited']
+    else:
+      counters.increment('targeted_walks')
+      found = findTestElements(self.ao, ids, HARNESS_IDS, stats)
+
+    for id, test_elem in found:
+      if id not in HARNESS_IDS:
+        elem = AccessibleElement(test_elem, self.target_fields.get(id, self.fields))
+        test_elements.append(elem)
+        # The first element wins, as with a linear search of test_elements
+        elements_by_id.setdefault(elem.test_id, elem)
+        if elem.unique_id is not None:
+          ids_by_unique_id[elem.unique_id] = elem.test_id
+
+    # Swap in the complete snapshot before moving to the next generation
+    self.test_elements = test_elements
+    self.elements_by_id = elements_by_id
+    self.ids_by_unique_id = ids_by_unique_id
+    self.missing_ids = set()
+    self.walk_stats = {'mode': 'full' if ids is None else 'targeted',
+                       'wanted': None if ids is None else len(set(ids)),
+                       'found': len(elements_by_id),
+                       'visited': stats['visited'],
+                       'total': self.node_count}
+    self.invalidate()
+
+  def getElementById(self, id):
+    elem = self.elements_by_id.get(id)
+    if elem is None and self.wanted_ids is not None and id and id not in self.missing_ids:
+      elem = self.findTestElement(id)
+    return elem
+
+  def findTestElement(self, id):
+    '''
+    Searches the document for the element with id, which a targeted walk did
+    not look for, and adds it to the test elements. Returns None if there is
+    no such element, remembering that until the next walk.
+    '''
+    if id in HARNESS_IDS:
+      return None
+
+    counters.increment('targeted_walks')
+    stats = {}
+    found = findTestElements(self.ao, (id,), HARNESS_IDS, stats)
+    visited = self.walk_stats.get('visited', 0) + stats['visited']
+    if not found:
+      self.missing_ids.add(id)
+      self.walk_stats = dict(self.walk_stats, visited=visited)
+      return None
+
+    elem = AccessibleElement(found[0][1], self.target_fields.get(id, self.fields))
+    elements_by_id = dict(self.elements_by_id)
+    elements_by_id[id] = elem
+    ids_by_unique_id = dict(self.ids_by_unique_id)
+    if elem.unique_id is not None:
+      ids_by_unique_id[elem.unique_id] = id
+
+    # Later walks look for it too
+    self.wanted_ids = self.wanted_ids | set([id])
+    self.test_elements = self.test_elements + [elem]
+    self.elements_by_id = elements_by_id
+    self.ids_by_unique_id = ids_by_unique_id
+    self.walk_stats = dict(self.walk_stats, wanted=len(self.wanted_ids), found=len(elements_by_id),
+                           visited=visited)
+    return elem
+
+  def setTargetFields(self, target_fields):
+    '''
+    Sets the fields to fetch for the test elements with the ids in
+    target_fields, e.g. those a test is known to check, and fetches them for
+    the elements already collected. Returns the number of elements loaded.
+    '''
+    self.target_fields = dict((id, tuple(self.fields) + tuple(fields))
+                              for id, fields in target_fields.items())
+
+    loaded = 0
+    for id, fields in self.target_fields.items():
+      elem = self.elements_by_id.get(id)
+      if elem is not None:
+        elem.load(fields)
+        loaded += 1
+    return loaded
+
+  def textChanged(self, unique_id=None):
+    '''
+    Drops the text attribute runs of the object with the IA2 uniqueID
+    unique_id, or of all objects if it is None, so the textAttributes of the
+    elements concerned are fetched again when next asked for.
+    '''
+    self.text_attributes.invalidate(unique_id)
+
+    if unique_id is None:
+      elems = self.test_elements
+    else:
+      # Called on the thread delivering events, so never searches the document
+      elem = self.elements_by_id.get(self.ids_by_unique_id.get(unique_id))
+      elems = [elem] if elem is not None and elem.unique_id == unique_id else []
+
+    for elem in elems:
+      elem.unload(('textAttributes',))
+    self.invalidate()
 
-    pred = lambda x: has_id(x)
-    test_elems = findAllDescendants(self.ao, pred)
+  def getTargetId(self, target):
+    '''
+    Returns the id of a relation target, looked up by its IA2 uniqueID so a
+    target costs a single COM call once its id is known.
+    '''
+    pacc2 = accessible2FromTarget(target)
+    if not isinstance(pacc2, IA2Lib.IAccessible2):
+      return ""
 
-    for test_elem in test_elems:
-      id = get_id(test_elem)
-      if id != 'manualMode' and id != 'log' and id != 'ATTAmessages':
-        self.test_elements.append(AccessibleElement(test_elem))
+    unique_id = pacc2.uniqueID
+    id = self.ids_by_unique_id.get(unique_id)
+    if id is None:
+      counters.increment('relation_target_misses')
+      id = self.ids_by_unique_id[unique_id] = get_id(pacc2)
+    return id
 
 
 
@@ -263,9 +538,30 @@ def accessibleObjectFromEvent(event):
   else:
     return None
 
+def accessibleObjectFromUniqueId(hwnd, unique_id):
+  '''
+  Returns the IAccessible of the object with the IA2 uniqueID unique_id in
+  window hwnd, as IA2 servers hand it out for events, for use by the calling
+  thread. Returns None if there is no such object any more.
+  '''
+  if not windll.user32.IsWindow(hwnd):
+    return None
+  ptr = POINTER(IAccessible)()
+  varChild = VARIANT()
+  res = windll.oleacc.AccessibleObjectFromEvent(
+    hwnd, OBJID_CLIENT, unique_id,
+    byref(ptr), byref(varChild))
+  if res == 0 and varChild.value == CHILDID_SELF:
+    return ptr.QueryInterface(IAccessible)
+  else:
+    return None
+
 def accessible2FromAccessible(pacc, child_id):
     debug = ""
 
+    if child_id==0 and isinstance(pacc,IA2Lib.IAccessible2):
+        return pacc
+
     if not isinstance(pacc, IAccessible):
         try:
             pacc = pacc.QueryInterface(IAccessible)
@@ -275,6 +571,7 @@ def accessible2FromAccessible(pacc, child_id):
     if child_id==0 and not isinstance(pacc,IA2Lib.IAccessible2):
         try:
             s=pacc.QueryInterface(IServiceProvider)
+            counters.increment('query_service')
             debug += "Got IServiceProvider"
             pacc2=s.QueryService(IALib._iid_, IA2Lib.IAccessible2)
             debug += "Got IA2Lib.IAccessible2"
@@ -288,7 +585,23 @@ def accessible2FromAccessible(pacc, child_id):
 
     return None
 
-def accessibleDocumentFromAccessible(pacc, child_id):
+def accessible2FromTarget(target):
+    '''
+    Returns the IAccessible2 of a relation target, asking the object itself
+    before falling back to QueryService.
+    '''
+    try:
+        return target.QueryInterface(IA2Lib.IAccessible2)
+    except COMError:
+        return accessible2FromAccessible(target, CHILDID_SELF)
+
+def _interfaceFromAccessible(pacc, child_id, interface):
+    '''
+    Returns the given IA2 interface of pacc through QueryService, pacc itself
+    if it already is one, or None if it has no such interface.
+    '''
+    if child_id==0 and isinstance(pacc, interface):
+        return pacc
 
     if not isinstance(pacc, IAccessible):
         try:
@@ -296,10 +609,11 @@ def accessibleDocumentFromAccessible(pacc, child_id):
         except COMError:
             raise RuntimeError("%s Not an IAccessible"%pacc)
 
-    if child_id==0 and not isinstance(pacc,IA2Lib.IAccessibleDocument):
+    if child_id==0:
         try:
             s=pacc.QueryInterface(IServiceProvider)
-            pacc2=s.QueryService(IALib._iid_, IA2Lib.IAccessibleDocument)
+            counters.increment('query_service')
+            pacc2=s.QueryService(IALib._iid_, interface)
             if not pacc2:
                 raise ValueError
             else:
@@ -308,125 +622,26 @@ def accessibleDocumentFromAccessible(pacc, child_id):
         except Exception as e:
           return None
 
-def accessibleImageFromAccessible(pacc, child_id):
-
-    if not isinstance(pacc, IAccessible):
-        try:
-            pacc = pacc.QueryInterface(IAccessible)
-        except COMError:
-            raise RuntimeError("%s Not an IAccessible"%pacc)
-
-    if child_id==0 and not isinstance(pacc,IA2Lib.IAccessibleImage):
-        try:
-            s=pacc.QueryInterface(IServiceProvider)
-            pacc2=s.QueryService(IALib._iid_, IA2Lib.IAccessibleImage)
-            if not pacc2:
-                raise ValueError
-            else:
-                return pacc2
+def accessibleDocumentFromAccessible(pacc, child_id):
+    return _interfaceFromAccessible(pacc, child_id, IA2Lib.IAccessibleDocument)
 
-        except Exception as e:
-          return None
+def accessibleImageFromAccessible(pacc, child_id):
+    return _interfaceFromAccessible(pacc, child_id, IA2Lib.IAccessibleImage)
 
 def accessibleTextFromAccessible(pacc, child_id):
-
-    if not isinstance(pacc, IAccessible):
-        try:
-            pacc = pacc.QueryInterface(IAccessible)
-        except COMError:
-            raise RuntimeError("%s Not an IAccessible"%pacc)
-
-    if child_id==0 and not isinstance(pacc,IA2Lib.IAccessibleText):
-        try:
-            s=pacc.QueryInterface(IServiceProvider)
-            pacc2=s.QueryService(IALib._iid_, IA2Lib.IAccessibleText)
-            if not pacc2:
-                raise ValueError
-            else:
-                return pacc2
-
-        except Exception as e:
-          return None
+    return _interfaceFromAccessible(pacc, child_id, IA2Lib.IAccessibleText)
 
 def accessibleHypertext2FromAccessible(pacc, child_id):
-
-    if not isinstance(pacc, IAccessible):
-        try:
-            pacc = pacc.QueryInterface(IAccessible)
-        except COMError:
-            raise RuntimeError("%s Not an IAccessible"%pacc)
-
-    if child_id==0 and not isinstance(pacc,IA2Lib.IAccessibleHypertext2):
-        try:
-            s=pacc.QueryInterface(IServiceProvider)
-            pacc2=s.QueryService(IALib._iid_, IA2Lib.IAccessibleHypertext2)
-            if not pacc2:
-                raise ValueError
-            else:
-                return pacc2
-
-        except Exception as e:
-          return None
+    return _interfaceFromAccessible(pacc, child_id, IA2Lib.IAccessibleHypertext2)
 
 def accessibleTable2FromAccessible(pacc, child_id):
-
-    if not isinstance(pacc, IAccessible):
-        try:
-            pacc = pacc.QueryInterface(IAccessible)
-        except COMError:
-            raise RuntimeError("%s Not an IAccessible"%pacc)
-
-    if child_id==0 and not isinstance(pacc,IA2Lib.IAccessibleTable2):
-        try:
-            s=pacc.QueryInterface(IServiceProvider)
-            pacc2=s.QueryService(IALib._iid_, IA2Lib.IAccessibleTable2)
-            if not pacc2:
-                raise ValueError
-            else:
-                return pacc2
-
-        except Exception as e:
-          return None
+    return _interfaceFromAccessible(pacc, child_id, IA2Lib.IAccessibleTable2)
 
 def accessibleTableCellFromAccessible(pacc, child_id):
-
-    if not isinstance(pacc, IAccessible):
-        try:
-            pacc = pacc.QueryInterface(IAccessible)
-        except COMError:
-            raise RuntimeError("%s Not an IAccessible"%pacc)
-
-    if child_id==0 and not isinstance(pacc,IA2Lib.IAccessibleTableCell):
-        try:
-            s=pacc.QueryInterface(IServiceProvider)
-            pacc2=s.QueryService(IALib._iid_, IA2Lib.IAccessibleTableCell)
-            if not pacc2:
-                raise ValueError
-            else:
-                return pacc2
-
-        except Exception as e:
-          return None
+    return _interfaceFromAccessible(pacc, child_id, IA2Lib.IAccessibleTableCell)
 
 def accessibleValueFromAccessible(pacc, child_id):
-
-    if not isinstance(pacc, IAccessible):
-        try:
-            pacc = pacc.QueryInterface(IAccessible)
-        except COMError:
-            raise RuntimeError("%s Not an IAccessible"%pacc)
-
-    if child_id==0 and not isinstance(pacc,IA2Lib.IAccessibleValue):
-        try:
-            s=pacc.QueryInterface(IServiceProvider)
-            pacc2=s.QueryService(IALib._iid_, IA2Lib.IAccessibleValue)
-            if not pacc2:
-                raise ValueError
-            else:
-                return pacc2
-
-        except Exception as e:
-          return None
+    return _interfaceFromAccessible(pacc, child_id, IA2Lib.IAccessibleValue)
 
 def com_coinitialize():
     CoInitializeEx(COINIT_MULTITHREADED)
@@ -509,9 +724,20 @@ def get_role(pacc):
 
     return value
 
-def get_extended_role(pacc):
+RoleInfo = collections.namedtuple("RoleInfo", ["role", "ia2_role", "localizedExtendedRole"])
 
+def get_role_info(pacc):
+    '''
+    Returns the MSAA role, IA2 role and localized extended role of pacc, asking
+    for its IAccessible2 interface and for each role only once.
+    '''
     pacc2 = accessible2FromAccessible(pacc, CHILDID_SELF)
+    return RoleInfo(get_role(pacc), _get_ia2_role(pacc2), _get_extended_role(pacc2))
+
+def get_extended_role(pacc):
+    return _get_extended_role(accessible2FromAccessible(pacc, CHILDID_SELF))
+
+def _get_extended_role(pacc2):
     try:
         value = pacc2.localizedExtendedRole
 
@@ -525,31 +751,119 @@ def get_extended_role(pacc):
     return value
 
 def get_ia2_role(pacc):
-    pacc2 = accessible2FromAccessible(pacc, CHILDID_SELF)
+    return _get_ia2_role(accessible2FromAccessible(pacc, CHILDID_SELF))
+
+def _get_ia2_role(pacc2):
     if isinstance(pacc2, IA2Lib.IAccessible2):
-      if pacc2.role() == 0:
-          return UNLOCALIZED_IA2_ROLE_NAMES[0]
-      else:
-        if pacc2.role() < 62:
-          return UNLOCALIZED_ROLE_NAMES[pacc2.role()]
-        else:
-          return UNLOCALIZED_IA2_ROLE_NAMES[pacc2.role()]
+      return ia2_role_name(pacc2.role())
 
     return ""
 
-def get_ia2_relation_set(pacc):
-    list = []
+class AccessibleRelation:
+  '''
+  An IA2 relation with its type name. Its targets are fetched with one call
+  to the targets property, or one target(j) call each if that fails, the
+  first time they are asked for, then kept.
+  '''
+
+  def __init__(self, relation):
+    self.relation = relation
+    self.type     = UNLOCALIZED_IA2_RELATION_TYPES.get(relation.relationType, relation.relationType)
+    self._targets = None
+
+  @property
+  def nTargets(self):
+    return len(self.getTargets())
+
+  def getTargets(self):
+    if self._targets is None:
+      relation = self.relation
+      self._targets = _get_items(relation, '_IAccessibleRelation__com__get_targets', IUnknown,
+                                 relation.nTargets, relation.target)
+    return self._targets
+
+def _get_array(method, interface, count):
+    '''
+    Returns the interfaces filled in by one call to the raw COM method of an
+    array property, e.g. IAccessible2::relations, for up to count items. The
+    comtypes wrappers of these properties only make room for a single item.
+    '''
+    if count <= 0:
+      return []
+
+    items = (POINTER(interface) * count)()
+    fetched = c_int()
+    counters.increment('com_calls')
+    method(count, items, byref(fetched))
+    return items[:fetched.value]
+
+def _get_items(pacc, method_name, interface, count, get_item):
+    '''
+    Returns the count items of an array property of pacc, fetched with one
+    call to its raw COM method called method_name (see _get_array). If that
+    call fails or returns fewer items, they are fetched one at a time with
+    get_item(index) instead, e.g. IAccessible2::relation.
+    '''
+    try:
+      items = _get_array(getattr(pacc, method_name), interface, count)
+      if len(items) == count:
+        return items
+    except Exception as e:
+      print "[_get_items] Exception calling %s:" % method_name, str(e)
+
+    counters.increment('array_call_fallbacks')
+    return [get_item(index) for index in range(count)]
+
+def get_ia2_relations(pacc):
+    '''
+    Returns an AccessibleRelation for each IA2 relation of pacc, fetching all
+    of them with one call to IAccessible2::relations, or one relation at a
+    time if that fails.
+    '''
+    relations = []
 
     pacc2 = accessible2FromAccessible(pacc, CHILDID_SELF)
     try:
-        for i in range (pacc2.nRelations):
-          type = pacc2.relation(i).relationType
-          list.append(UNLOCALIZED_IA2_RELATION_TYPES[type])
-#          list.append(type)
+        items = _get_items(pacc2, '_IAccessible2__com__get_relations', IA2Lib.IAccessibleRelation,
+                           pacc2.nRelations, pacc2.relation)
+        for relation in items:
+          relations.append(AccessibleRelation(relation))
 
     except Exception as e:
-        print "ERROR cannot get IA2 relation:", str(e)
-    return list
+        print "ERROR cannot get IA2 relations:", str(e)
+    return relations
+
+def get_ia2_relation_set(pacc):
+    return [relation.type for relation in get_ia2_relations(pacc)]
+
+def get_ia2_relation_targets(pacc, get_target_id=None, relation_types=None, relations=None):
+    '''
+    Returns an ordered dict mapping the type name of each IA2 relation of pacc
+    (e.g. IA2_RELATION_LABELLED_BY) to the ids of its targets. get_target_id
+    maps a target to its id, by default with get_id(). Only the targets of
+    relations named in relation_types are resolved, if it is given. relations
+    are the AccessibleRelations of pacc when already fetched.
+    '''
+    if get_target_id is None:
+        get_target_id = lambda target: get_id(accessible2FromTarget(target))
+
+    targets = collections.OrderedDict()
+
+    try:
+        if relations is None:
+          relations = get_ia2_relations(pacc)
+
+        for relation in relations:
+          if relation_types is not None and relation.type not in relation_types:
+            continue
+
+          ids = targets.setdefault(relation.type, [])
+          for target in relation.getTargets():
+            ids.append(get_target_id(target))
+
+    except Exception as e:
+        print "ERROR cannot get IA2 relation targets:", str(e)
+    return targets
 
 def get_ia2_group_position(pacc):
     value = (-1, -1, -1)
@@ -570,35 +884,22 @@ def get_ia2_group_position(pacc):
 
 
 def get_state_set(pacc):
-    list = []
-
-    states = pacc.accState(CHILDID_SELF)
-    for item in UNLOCALIZED_STATE_NAMES:
-      if item & states:
-        list.append(UNLOCALIZED_STATE_NAMES[item])
+    names = decode_states(pacc.accState(CHILDID_SELF))
 
     pacc2 = accessible2FromAccessible(pacc, CHILDID_SELF)
 
     if isinstance(pacc2, IA2Lib.IAccessible2):
-      states = pacc2.states
-      for item in UNLOCALIZED_IA2_STATE_NAMES:
-        if item & states:
-          list.append(UNLOCALIZED_IA2_STATE_NAMES[item])
+      names = names + decode_ia2_states(pacc2.states)
 
-    return list
+    return list(names)
 
 def get_ia2_state_set(pacc):
-    list = []
-
     pacc2 = accessible2FromAccessible(pacc, CHILDID_SELF)
 
     if isinstance(pacc2, IA2Lib.IAccessible2):
-      states = pacc2.states
-      for item in UNLOCALIZED_IA2_STATE_NAMES:
-        if item & states:
-          list.append(UNLOCALIZED_IA2_STATE_NAMES[item])
+      return list(decode_ia2_states(pacc2.states))
 
-    return list
+    return []
 
 def get_ia2_attributes(pacc):
     pacc2 = accessible2FromAccessible(pacc, CHILDID_SELF)
@@ -617,7 +918,40 @@ def get_ia2_attribute_set(pacc):
 
     return []
 
-def get_ia2_text_attribute_set(pacc):
+def get_ia2_text_attribute_runs(pacc, cache=None, unique_id=None):
+    '''
+    Returns the TextAttributeRuns of pacc, taken from cache if it holds those
+    of unique_id and added to it otherwise.
+    '''
+    cached = cache is not None and unique_id is not None
+    if cached:
+        runs = cache.get(unique_id)
+        if runs is not None:
+            return runs
+
+    runs = TextAttributeRuns()
+    pacc2 = accessibleTextFromAccessible(pacc, CHILDID_SELF)
+    if isinstance(pacc2, IA2Lib.IAccessibleText):
+        try:
+            runs = TextAttributeRuns.walk(pacc2)
+        except:
+            # Not cached, the next build asks again
+            return runs
+
+    if cached:
+        cache.add(unique_id, runs)
+    return runs
+
+def get_ia2_text_attribute_set(pacc, offset=IA2_TEXT_OFFSET_LENGTH, cache=None, unique_id=None):
+    '''
+    Returns the text attributes of pacc at offset as 'name:value' strings.
+    IA2_TEXT_OFFSET_LENGTH is asked of the server with a single call; other
+    offsets are looked up in the attribute runs of pacc, walked the first
+    time one is asked for.
+    '''
+    if offset != IA2_TEXT_OFFSET_LENGTH:
+        return get_ia2_text_attribute_runs(pacc, cache, unique_id).getAttributeSet(offset)
+
     pacc2 = accessibleTextFromAccessible(pacc, CHILDID_SELF)
     if isinstance(pacc2, IA2Lib.IAccessibleText):
         # -1 means using the constant
@@ -635,6 +969,13 @@ def get_type_set(pacc):
     list = []
     return list
 
+def get_unique_id(pacc):
+    pacc2 = accessible2FromAccessible(pacc, CHILDID_SELF)
+    if isinstance(pacc2, IA2Lib.IAccessible2):
+      return pacc2.uniqueID
+
+    return None
+
 def get_id(pacc):
     pacc2 = accessible2FromAccessible(pacc, CHILDID_SELF)
     if isinstance(pacc2, IA2Lib.IAccessible2):
@@ -659,44 +1000,105 @@ def has_id(pacc):
 
 
 
-def get_interface_set(pacc):
-    list = []
-
-    pacc2 = accessible2FromAccessible(pacc, CHILDID_SELF)
-    if isinstance(pacc2, IA2Lib.IAccessible2):
-      list.append('IAccessible2')
-
-    pacc2 = accessibleDocumentFromAccessible(pacc, CHILDID_SELF)
-    if isinstance(pacc2, IA2Lib.IAccessibleDocument):
-      list.append('IAccessibleDocument')
-
-    pacc2 = accessibleTextFromAccessible(pacc, CHILDID_SELF)
-    if isinstance(pacc2, IA2Lib.IAccessibleText):
-      list.append('IAccessibleText')
-
-    pacc2 = accessibleHypertext2FromAccessible(pacc, CHILDID_SELF)
-    if isinstance(pacc2, IA2Lib.IAccessibleHypertext2):
-      list.append('IAccessibleHypertext2')
-
-    pacc2 = accessibleImageFromAccessible(pacc, CHILDID_SELF)
-    if isinstance(pacc2, IA2Lib.IAccessibleImage):
-      list.append('IAccessibleImage')
+# Interfaces reported by get_interface_set, with the function asking for each
+_interface_probes = collections.OrderedDict([
+    ('IAccessible2',          (accessible2FromAccessible, IA2Lib.IAccessible2)),
+    ('IAccessibleDocument',   (accessibleDocumentFromAccessible, IA2Lib.IAccessibleDocument)),
+    ('IAccessibleText',       (accessibleTextFromAccessible, IA2Lib.IAccessibleText)),
+    ('IAccessibleHypertext2', (accessibleHypertext2FromAccessible, IA2Lib.IAccessibleHypertext2)),
+    ('IAccessibleImage',      (accessibleImageFromAccessible, IA2Lib.IAccessibleImage)),
+    ('IAccessibleTable2',     (accessibleTable2FromAccessible, IA2Lib.IAccessibleTable2)),
+    ('IAccessibleTableCell',  (accessibleTableCellFromAccessible, IA2Lib.IAccessibleTableCell)),
+    ('IAccessibleValue',      (accessibleValueFromAccessible, IA2Lib.IAccessibleValue)),
+])
+
+INTERFACE_NAMES = tuple(_interface_probes)
+
+def query_interface(pacc, name):
+    '''
+    Returns the interface called name (e.g. IAccessibleText) of pacc, or None.
+    '''
+    probe, interface = _interface_probes[name]
+    pacc2 = probe(pacc, CHILDID_SELF)
+    if isinstance(pacc2, interface):
+      return pacc2
+    return None
 
-    pacc2 = accessibleTable2FromAccessible(pacc, CHILDID_SELF)
-    if isinstance(pacc2, IA2Lib.IAccessibleTable2):
-      list.append('IAccessibleTable2')
+def get_interface_set(pacc):
+    return [name for name in INTERFACE_NAMES if query_interface(pacc, name) is not None]
+
+# Fields AccessibleElement.load() fetches, with the interface each needs, the
+# function fetching it from that interface and its value when the element has
+# no such interface. Fields needing no interface are fetched from the
+# IAccessible2 of the element, or its IAccessible if it has none, as are those
+# of IAccessible2 if it has none. Fields needing the same interface are next
+# to one another.
+_element_loaders = collections.OrderedDict([
+    ('accName',             (None, lambda pacc: get_name(pacc), '')),
+    ('accValue',            (None, lambda pacc: get_value(pacc), '')),
+    ('accDescription',      (None, lambda pacc: get_description(pacc), '')),
+    ('accKeyboardShortcut', (None, lambda pacc: get_keyboard_shortcut(pacc), '')),
+    ('states',              ('IAccessible2', lambda pacc: get_state_set(pacc), [])),
+    ('objectAttributes',    ('IAccessible2', lambda pacc: get_ia2_attribute_set(pacc), [])),
+    ('groupPosition',       ('IAccessible2', lambda pacc: get_ia2_group_position(pacc), '')),
+    ('ia2_relations',       ('IAccessible2', lambda pacc: get_ia2_relations(pacc), [])),
+    ('textAttributes',      ('IAccessibleText', lambda pacc: get_ia2_text_attribute_set(pacc), [])),
+    ('ia2_value',           ('IAccessibleValue', lambda pacc: get_ia2_value(pacc), None)),
+    ('columnExtent',        ('IAccessibleTableCell', lambda pacc: get_column_extent(pacc), None)),
+    ('rowExtent',           ('IAccessibleTableCell', lambda pacc: get_row_extent(pacc), None)),
+])
+
+ELEMENT_FIELDS = frozenset(_element_loaders)
+
+# Fields whose values hold COM pointers, only valid in the apartment of the
+# thread that fetched them
+APARTMENT_FIELDS = frozenset(['ia2_relations'])
+
+def _load_fields(pacc, fields):
+    '''
+    Returns (field, value) pairs for fields, all needing the same interface,
+    fetched through pacc, that interface, or None if the element has none.
+    '''
+    values = []
+    for field in fields:
+      interface, loader, missing = _element_loaders[field]
+      values.append((field, loader(pacc) if pacc is not None else missing))
+    return values
 
-    pacc2 = accessibleTableCellFromAccessible(pacc, CHILDID_SELF)
-    if isinstance(pacc2, IA2Lib.IAccessibleTableCell):
-      list.append('IAccessibleTableCell')
+def fetchElementFields(locator, name, fields):
+    '''
+    Returns (field, value) pairs for fields, all needing the interface called
+    name, of the element at locator (see AccessibleElement.getLocator()). The
+    element is found again on the calling thread, e.g. a worker thread in
+    another COM apartment, so no pointer crosses threads. Returns None if the
+    element is gone or its fields could not be fetched.
+    '''
+    try:
+      ao = accessibleObjectFromUniqueId(*locator)
+      if ao is None:
+        return None
 
-    pacc2 = accessibleValueFromAccessible(pacc, CHILDID_SELF)
-    if isinstance(pacc2, IA2Lib.IAccessibleValue):
-      list.append('IAccessibleValue')
+      pacc2 = accessible2FromAccessible(ao, CHILDID_SELF)
+      if not isinstance(pacc2, IA2Lib.IAccessible2) or pacc2.uniqueID != locator[1]:
+        return None
 
+      if name == 'IAccessible2':
+        pacc = pacc2
+      else:
+        pacc = query_interface(ao, name)
+      return _load_fields(pacc, fields)
 
+    except Exception as e:
+      print "[fetchElementFields] Exception cannot fetch %s fields:" % name, str(e)
+      return None
 
-    return list
+# Fields set when loading another one
+_element_field_sources = {
+    'relations':         'ia2_relations',
+    'ia2_value_min':     'ia2_value',
+    'ia2_value_current': 'ia2_value',
+    'ia2_value_max':     'ia2_value',
+}
 
 def get_ia2_property_value(pacc, property):
 
@@ -780,25 +1182,18 @@ def get_row_extent(pacc):
 
 
 def get_relation_set(pacc):
-    pacc2 = self.accessible2FromAccessible(pacc, CHILDID_SELF)
+    pacc2 = accessible2FromAccessible(pacc, CHILDID_SELF)
     if isinstance(pacc2, IA2Lib.IAccessible2):
         out = "Relation info:"
         try:
-            out +=  "  Number(" + str(pacc2.nRelations) + ")\n\r "
-
-        except Exception as e:
-            print "ERROR cannot get IA2 nRelation:", str(e)
+            targets = get_ia2_relation_targets(pacc2)
+            out +=  "  Number(" + str(len(targets)) + ")\n\r "
 
-        try:
-            for i in range (pacc2.nRelations):
-              out +=  "[Type: " + pacc2.relation(i).relationType + "; "
-              out +=  "Targets(" + str(pacc2.relation(i).nTargets) + ") "
-              for j in range(pacc2.relation(i).nTargets):
-                t = pacc2.relation(i).target(j)
-                s=t.QueryInterface(IServiceProvider)
-                oa2=s.QueryService(IALib._iid_, IA2Lib.IAccessible2)
-
-                out += "'" + str(oa2) + "'"
+            for type, ids in targets.items():
+              out +=  "[Type: " + type + "; "
+              out +=  "Targets(" + str(len(ids)) + ") "
+              for id in ids:
+                out += "'" + id + "'"
 
               out += "]"
 
@@ -810,124 +1205,48 @@ def get_relation_set(pacc):
     return "None"
 
 
-def findDescendant(acc, pred, breadth_first=False):
+def findTestElements(acc, ids=None, prune_ids=(), stats=None):
   '''
-  Searches for a descendant node satisfying the given predicate starting at
-  this node. The search is performed in depth-first order by default or
-  in breadth first order if breadth_first is True. For example,
-
-  my_win = findDescendant(lambda x: x.name == 'My Window')
-
-  will search all descendants of x until one is located with the name 'My
-  Window' or all nodes are exausted. Calls L{_findDescendantDepth} or
-  L{_findDescendantBreadth} to start the recursive search.
+  Collects the descendants of acc with an id, in document order, as a list of
+  (id, accessible) pairs. With ids, only the first descendant with each of
+  those ids is collected and the walk stops as soon as all are found. The
+  subtrees of descendants with an id in prune_ids are not searched.
 
   @param acc: Root accessible of the search
   @type acc: Accessibility.Accessible
-  @param pred: Search predicate returning True if accessible matches the
-  search criteria or False otherwise
-  @type pred: callable
-  @param breadth_first: Search breadth first (True) or depth first (False)?
-  @type breadth_first: boolean
-  @return: Accessible matching the criteria or None if not found
-  @rtype: Accessibility.Accessible or None
-  '''
-  if breadth_first:
-    return _findDescendantBreadth(acc, pred)
-
-  for child in acc:
-    try:
-      ret = _findDescendantDepth(acc, pred)
-    except Exception:
-      ret = None
-    if ret is not None: return ret
-
-def _findDescendantBreadth(acc, pred):
-  '''
-  Internal function for locating one descendant. Called by L{findDescendant} to
-  start the search.
-
-  @param acc: Root accessible of the search
-  @type acc: Accessibility.Accessible
-  @param pred: Search predicate returning True if accessible matches the
-  search criteria or False otherwise
-  @type pred: callable
-  @return: Matching node or None to keep searching
-  @rtype: Accessibility.Accessible or None
-  '''
-  for child in acc:
-    try:
-      if pred(child): return child
-    except Exception:
-      pass
-  for child in acc:
-    try:
-      ret = _findDescendantBreadth(child, pred)
-    except Exception:
-      ret = None
-    if ret is not None: return ret
-
-def _findDescendantDepth(acc, pred):
+  @param ids: Ids to look for, or None for all of them
+  @type ids: iterable
+  @param prune_ids: Ids of descendants whose subtrees are skipped
+  @type prune_ids: iterable
+  @param stats: Dictionary updated with the number of nodes 'visited'
+  @type stats: dict
+  @return: The (id, accessible) pairs found
+  @rtype: list
   '''
-  Internal function for locating one descendant. Called by L{findDescendant} to
-  start the search.
+  wanted = set(ids) if ids is not None else None
+  found = []
 
-  @param acc: Root accessible of the search
-  @type acc: Accessibility.Accessible
-  @param pred: Search predicate returning True if accessible matches the
-  search criteria or False otherwise
-  @type pred: callable
-  @return: Matching node or None to keep searching
-  @rtype: Accessibility.Accessible or None
-  '''
-  try:
-    if pred(acc): return acc
-  except Exception:
-    pass
-  for child in acc:
+  def visit(node, depth):
     try:
-      ret = _findDescendantDepth(child, pred)
+      id = get_id(node)
     except Exception:
-      ret = None
-    if ret is not None: return ret
-
-def findAllDescendants(acc, pred):
-  '''
-  Searches for all descendant nodes satisfying the given predicate starting at
-  this node. Does an in-order traversal. For example,
-
-  pred = lambda x: x.getRole() == pyatspi.ROLE_PUSH_BUTTON
-  buttons = pyatspi.findAllDescendants(node, pred)
-
-  will locate all push button descendants of node.
-
-  @param acc: Root accessible of the search
-  @type acc: Accessibility.Accessible
-  @param pred: Search predicate returning True if accessible matches the
-      search criteria or False otherwise
-  @type pred: callable
-  @return: All nodes matching the search criteria
-  @rtype: list
-  '''
-  matches = []
-  _findAllDescendants(acc, pred, matches)
-  return matches
-
-def _findAllDescendants(acc, pred, matches):
-  '''
-  Internal method for collecting all descendants. Reuses the same matches
-  list so a new one does not need to be built on each recursive step.
-  '''
-
-  try:
-      for child in acc:
-        try:
-          if pred(child): matches.append(child)
-        except Exception:
-          pass
-        _findAllDescendants(child, pred, matches)
-  except:
-    pass
+      id = ""
+
+    if id:
+      if wanted is None:
+        found.append((id, node))
+      elif id in wanted:
+        found.append((id, node))
+        wanted.discard(id)
+        if not wanted:
+          return WALK_STOP
+      if id in prune_ids:
+        return WALK_SKIP
+
+  visited = walkDescendants(acc, visit) if wanted != set() else 0
+  if stats is not None:
+    stats['visited'] = stats.get('visited', 0) + visited
+  return found
 
 def findAncestor(acc, pred):
     if acc is None:
@@ -0,0 +1,173 @@
+'''
+Walks over the descendants of an accessible, from a stack or a queue so each
+node is visited and its children enumerated once, and the searches built on
+them.
+
+Inspired by pyatspi:
+http://live.gnome.org/GAP/PythonATSPI
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Library General Public
+License as published by the Free Software Foundation; either
+version 2 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Library General Public License for more details.
+
+You should have received a copy of the GNU Library General Public
+License along with this library; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+'''
+
+import collections
+
+from stats import counters
+
+
+# What the visitor of walkDescendants returns for each node: go on into its
+# children (None does the same), skip its children or end the walk
+WALK_DESCEND, WALK_SKIP, WALK_STOP = range(3)
+
+_end_of_children = object()
+
+def getChildren(acc):
+  '''
+  Returns the children of acc as a list, or an empty list if they cannot be
+  enumerated, so a walk enumerates the children of each node only once.
+  '''
+  try:
+    return list(acc)
+  except Exception:
+    return []
+
+def walkDescendants(acc, visit, breadth_first=False, max_depth=None):
+  '''
+  Calls visit(node, depth) on the descendants of acc, in depth-first (document)
+  order by default or in breadth-first order if breadth_first is True. The
+  children of acc are at depth 1. Each node is visited once and its children
+  enumerated once, from a stack or a queue rather than by recursion, so the
+  walk takes time linear in the nodes visited however wide or deep the tree.
+
+  @param acc: Root accessible of the walk
+  @type acc: Accessibility.Accessible
+  @param visit: Called on each node, returning WALK_DESCEND or None to visit
+      its children, WALK_SKIP not to, or WALK_STOP to end the walk
+  @type visit: callable
+  @param breadth_first: Walk breadth first (True) or depth first (False)?
+  @type breadth_first: boolean
+  @param max_depth: Depth of the deepest nodes visited, or None for no limit
+  @type max_depth: integer
+  @return: The number of nodes visited
+  @rtype: integer
+  '''
+  visited = 0
+  # Nodes whose children were listed
+  parents = 0
+
+  if breadth_first:
+    queue = collections.deque([(acc, 0)])
+    while queue:
+      parent, depth = queue.popleft()
+      depth += 1
+      parents += 1
+      for child in getChildren(parent):
+        visited += 1
+        action = visit(child, depth)
+        if action == WALK_STOP:
+          queue.clear()
+          break
+        if action != WALK_SKIP and (max_depth is None or depth < max_depth):
+          queue.append((child, depth))
+  else:
+    # Iterators over the children of the nodes on the path to the current one
+    stack = [iter(getChildren(acc))]
+    parents += 1
+    while stack:
+      child = next(stack[-1], _end_of_children)
+      if child is _end_of_children:
+        stack.pop()
+        continue
+
+      visited += 1
+      depth = len(stack)
+      action = visit(child, depth)
+      if action == WALK_STOP:
+        break
+      if action != WALK_SKIP and (max_depth is None or depth < max_depth):
+        stack.append(iter(getChildren(child)))
+        parents += 1
+
+  counters.increment('tree_walk_nodes', visited)
+  counters.increment('child_lists', parents)
+  return visited
+
+def findDescendant(acc, pred, breadth_first=False, max_depth=None):
+  '''
+  Searches for a descendant node satisfying the given predicate starting at
+  this node. The search is performed in depth-first order by default or
+  in breadth first order if breadth_first is True. For example,
+
+  my_win = findDescendant(lambda x: x.name == 'My Window')
+
+  will search all descendants of x until one is located with the name 'My
+  Window' or all nodes are exausted. Calls L{walkDescendants} to do the
+  search.
+
+  @param acc: Root accessible of the search
+  @type acc: Accessibility.Accessible
+  @param pred: Search predicate returning True if accessible matches the
+  search criteria or False otherwise
+  @type pred: callable
+  @param breadth_first: Search breadth first (True) or depth first (False)?
+  @type breadth_first: boolean
+  @param max_depth: Depth of the deepest nodes searched, or None for no limit
+  @type max_depth: integer
+  @return: Accessible matching the criteria or None if not found
+  @rtype: Accessibility.Accessible or None
+  '''
+  matches = []
+
+  def visit(node, depth):
+    try:
+      if pred(node):
+        matches.append(node)
+        return WALK_STOP
+    except Exception:
+      pass
+
+  walkDescendants(acc, visit, breadth_first, max_depth)
+  return matches[0] if matches else None
+
+def findAllDescendants(acc, pred, max_depth=None):
+  '''
+  Searches for all descendant nodes satisfying the given predicate starting at
+  this node. Does an in-order traversal. For example,
+
+  pred = lambda x: x.getRole() == pyatspi.ROLE_PUSH_BUTTON
+  buttons = pyatspi.findAllDescendants(node, pred)
+
+  will locate all push button descendants of node.
+
+  @param acc: Root accessible of the search
+  @type acc: Accessibility.Accessible
+  @param pred: Search predicate returning True if accessible matches the
+      search criteria or False otherwise
+  @type pred: callable
+  @param max_depth: Depth of the deepest nodes searched, or None for no limit
+  @type max_depth: integer
+  @return: All nodes matching the search criteria
+  @rtype: list
+  '''
+  matches = []
+
+  def visit(node, depth):
+    try:
+      if pred(node): matches.append(node)
+    except Exception:
+      pass
+
+  walkDescendants(acc, visit, max_depth=max_depth)
+  return matches
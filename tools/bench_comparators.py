@@ -0,0 +1,103 @@
+#!/usr/bin/env python27
+#
+# bench_comparators
+# Times the assertion comparators of win_atta_assertion against the comparator
+# table they replaced, over assertions modelled on the core-aam and html-aam tests
+#
+# Developed by Jon Gunderson, Mihir Kumar and Bei Zhang
+# Copyright (c) 2017 University of Illinois
+# Based on the ATTAs developed by Joanmarie Diggs (@joanmarie)
+#
+# For license information, see:
+# https://www.w3.org/Consortium/Legal/2008/04-testsuite-copyright.html
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from win_atta_assertion import assertion_compiler
+
+
+# The comparators before assertions were compiled: every comparison tried
+# float() on both values and looked its test up by name
+def _compare(a, b):
+    if a == b:
+        return 0
+
+    try:
+        a = float(a)
+        b = float(b)
+    except:
+        return None
+
+    return min(max(a - b, -1), 1)
+
+_comparators = {
+    "is": lambda a, e: _compare(a, e) == 0,
+    "isNot": lambda a, e: _compare(a, e) != 0,
+    "isLT": lambda a, e: _compare(a, e) == -1,
+    "isGT": lambda a, e: _compare(a, e) == 1,
+    "isLTE": lambda a, e: _compare(a, e) in [0, -1],
+    "isGTE": lambda a, e: _compare(a, e) in [0, 1],
+    "contains": lambda a, e: a and e in a,
+    "isAny": lambda a, e: a in e,
+}
+
+def evaluate(test, actual, expected):
+    comparator = _comparators[test]
+    result = comparator(actual, expected)
+    trimmed = actual.strip() if type(actual) is unicode and actual[-1:] == " " else False
+    if not result and trimmed and test == "is":
+        result = comparator(trimmed, expected)
+    return result
+
+
+# (test, actual, expected), mostly role and name string checks as in the WPT tests
+CORPUS = [
+    ("is", u"ROLE_SYSTEM_PUSHBUTTON", u"ROLE_SYSTEM_PUSHBUTTON"),
+    ("is", u"ROLE_SYSTEM_TEXT", u"ROLE_SYSTEM_PUSHBUTTON"),
+    ("is", u"Label ", u"Label"),
+    ("isNot", u"ROLE_SYSTEM_TEXT", u"ROLE_SYSTEM_GROUPING"),
+    ("contains", [u"STATE_SYSTEM_FOCUSABLE", u"IA2_STATE_EDITABLE"], u"IA2_STATE_EDITABLE"),
+    ("isAny", u"ROLE_SYSTEM_TEXT", [u"ROLE_SYSTEM_STATICTEXT", u"ROLE_SYSTEM_TEXT", u"IA2_ROLE_PARAGRAPH"]),
+    ("is", u"5", u"5"),
+    ("isLT", u"3", u"5"),
+    ("isGTE", 7, u"5"),
+    ("is", None, u"None"),
+    ("isNot", u"", u"None"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the compiled assertion comparators against the comparator table they replaced.")
+    parser.add_argument("--number", "-n", type=int, default=20000, help="passes over the corpus per timing")
+    parser.add_argument("--repeat", "-r", type=int, default=5, help="timings to take the best of")
+    options = parser.parse_args()
+
+    plans = []
+    for test, actual, expected in CORPUS:
+        raw = u"[%s]" % u",".join(expected) if isinstance(expected, list) else expected
+        plan = assertion_compiler.compile(["property", "name", test, raw])
+        if plan.compare(actual, plan.expected_value) != bool(evaluate(test, actual, expected)):
+            raise SystemExit("Comparators disagree on %r" % ((test, actual, expected),))
+        plans.append((plan.compare, actual, plan.expected_value, test, expected))
+
+    def run_table():
+        for compare, actual, value, test, expected in plans:
+            evaluate(test, actual, expected)
+
+    def run_compiled():
+        for compare, actual, value, test, expected in plans:
+            compare(actual, value)
+
+    comparisons = options.number * len(plans)
+    for name, run in (("table", run_table), ("compiled", run_compiled)):
+        best = min(timeit.repeat(run, number=options.number, repeat=options.repeat))
+        print("%-8s %7.0f ns/comparison" % (name, best / comparisons * 1e9))
+
+
+if __name__ == "__main__":
+    main()
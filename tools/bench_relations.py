@@ -0,0 +1,126 @@
+#!/usr/bin/env python27
+#
+# bench_relations
+# Times fetching the IA2 relations and relation targets of the elements of a
+# test document with the array properties against reading them per index
+#
+# Developed by Jon Gunderson, Mihir Kumar and Bei Zhang
+# Copyright (c) 2017 University of Illinois
+# Based on the ATTAs developed by Joanmarie Diggs (@joanmarie)
+#
+# For license information, see:
+# https://www.w3.org/Consortium/Legal/2008/04-testsuite-copyright.html
+#
+# Start it, then load the test document, e.g. tests/test_relation_label_for.html,
+# in a browser with its accessibility APIs enabled.
+
+import argparse
+import collections
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pyia2
+from pyia2.constants import CHILDID_SELF, UNLOCALIZED_IA2_RELATION_TYPES
+
+
+# Relations before the array properties were used: nRelations, then
+# relation(i), relationType, nTargets and target(j) per index
+def get_relation_set(pacc):
+    pacc2 = pyia2.accessible2FromAccessible(pacc, CHILDID_SELF)
+    return [UNLOCALIZED_IA2_RELATION_TYPES[pacc2.relation(i).relationType]
+            for i in range(pacc2.nRelations)]
+
+def get_relation_targets(pacc):
+    targets = collections.OrderedDict()
+    pacc2 = pyia2.accessible2FromAccessible(pacc, CHILDID_SELF)
+    for i in range(pacc2.nRelations):
+        relation = pacc2.relation(i)
+        type = UNLOCALIZED_IA2_RELATION_TYPES.get(relation.relationType, relation.relationType)
+        ids = targets.setdefault(type, [])
+        for j in range(relation.nTargets):
+            ids.append(pyia2.get_id(pyia2.accessible2FromTarget(relation.target(j))))
+    return targets
+
+
+def get_targets(pacc):
+    return pyia2.get_ia2_relation_targets(pacc, relations=pyia2.get_ia2_relations(pacc))
+
+def get_cached_targets(relations):
+    return lambda pacc: pyia2.get_ia2_relation_targets(pacc, relations=relations[pacc])
+
+
+def wait_for_document(suffix, timeout):
+    """Returns the accessible of the first document whose URI ends with suffix
+    to finish loading, or None after timeout seconds."""
+
+    documents = []
+
+    def on_load_complete(event):
+        ao = pyia2.accessibleObjectFromEvent(event)
+        if ao is not None and (pyia2.get_value(ao) or "").endswith(suffix):
+            documents.append(ao)
+
+    pyia2.Registry.registerEventListener(on_load_complete, pyia2.IA2_EVENT_DOCUMENT_LOAD_COMPLETE)
+    deadline = time.time() + timeout
+    try:
+        while not documents and time.time() < deadline:
+            pyia2.Registry.iter_loop(1)
+    finally:
+        pyia2.Registry.clearListeners()
+    return documents[0] if documents else None
+
+
+def measure(fetch, elements, repeat):
+    """Returns the milliseconds taken to call fetch on every element, per pass,
+    and what the last pass returned."""
+
+    start = time.time()
+    for _ in range(repeat):
+        values = [fetch(ao) for id, ao in elements]
+    return (time.time() - start) * 1e3 / repeat, values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times fetching the IA2 relations of a test document with the array properties against reading them per index.")
+    parser.add_argument("--document", default="test_relation_label_for.html", help="end of the URI of the test document")
+    parser.add_argument("--repeat", "-r", type=int, default=100, help="passes over the elements per timing")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for the document to load")
+    options = parser.parse_args()
+
+    print("Waiting for a document ending with %s to load..." % options.document)
+    ao = wait_for_document(options.document, options.timeout)
+    if ao is None:
+        raise SystemExit("No document ending with %s loaded" % options.document)
+
+    elements = pyia2.findTestElements(ao)
+    relations = dict((ao, pyia2.get_ia2_relations(ao)) for id, ao in elements)
+    print("%d elements with ids, %d relations" % (len(elements), sum(len(r) for r in relations.values())))
+
+    timings = [
+        ("relation types", [("per index", get_relation_set),
+                            ("array", lambda pacc: [r.type for r in pyia2.get_ia2_relations(pacc)])]),
+        ("relation targets", [("per index", get_relation_targets),
+                              ("array", get_targets),
+                              ("array, cached", get_cached_targets(relations))]),
+    ]
+    for name, fetches in timings:
+        expected = None
+        for fetch_name, fetch in fetches:
+            pyia2.counters.reset()
+            ms, values = measure(fetch, elements, options.repeat)
+            counts = pyia2.counters.snapshot()
+            com_calls = counts.get("com_calls", 0) / float(options.repeat)
+            if counts.get("array_call_fallbacks"):
+                print("  %s fell back to per index calls %d times" % (fetch_name, counts["array_call_fallbacks"]))
+            if expected is None:
+                expected = values
+            elif values != expected:
+                print("  %s and per index disagree: %r != %r" % (fetch_name, values, expected))
+            print("%-18s %-14s %8.3f ms per pass, %5.1f array calls" % (name, fetch_name, ms, com_calls))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python27
+#
+# bench_tree_search
+# Times the stack and queue based descendant searches of pyia2 against the
+# recursive searches they replaced, on wide synthetic trees
+#
+# Developed by Jon Gunderson, Mihir Kumar and Bei Zhang
+# Copyright (c) 2017 University of Illinois
+# Based on the ATTAs developed by Joanmarie Diggs (@joanmarie)
+#
+# For license information, see:
+# https://www.w3.org/Consortium/Legal/2008/04-testsuite-copyright.html
+
+import argparse
+import os
+import sys
+import time
+
+# pyia2/walk.py does not need comtypes, so it is imported on its own rather
+# than through the pyia2 package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pyia2"))
+
+import walk
+
+
+# The searches before the walk was shared: breadth first listed the children
+# of each node twice, and depth first restarted from acc for every child
+def find_descendant(acc, pred, breadth_first=False):
+    if breadth_first:
+        return _find_descendant_breadth(acc, pred)
+
+    for child in acc:
+        try:
+            ret = _find_descendant_depth(acc, pred)
+        except Exception:
+            ret = None
+        if ret is not None:
+            return ret
+
+def _find_descendant_breadth(acc, pred):
+    for child in acc:
+        try:
+            if pred(child):
+                return child
+        except Exception:
+            pass
+    for child in acc:
+        try:
+            ret = _find_descendant_breadth(child, pred)
+        except Exception:
+            ret = None
+        if ret is not None:
+            return ret
+
+def _find_descendant_depth(acc, pred):
+    try:
+        if pred(acc):
+            return acc
+    except Exception:
+        pass
+    for child in acc:
+        try:
+            ret = _find_descendant_depth(child, pred)
+        except Exception:
+            ret = None
+        if ret is not None:
+            return ret
+
+
+class Node(object):
+    """A node of a synthetic tree, counting how often its children are listed
+    and spending cost seconds per child listed, as enumerating the children of
+    an accessible over COM does."""
+
+    __slots__ = ("children",)
+
+    listed = 0
+    cost = 0.0
+
+    def __init__(self):
+        self.children = []
+
+    def __iter__(self):
+        Node.listed += 1
+        if Node.cost:
+            end = time.time() + Node.cost * len(self.children)
+            while time.time() < end:
+                pass
+        return iter(self.children)
+
+
+def build(width, depth):
+    """Returns the root of a tree with width children per node down to depth,
+    and the number of nodes below the root."""
+
+    root = Node()
+    size = 0
+    level = [root]
+    for _ in range(depth):
+        next_level = []
+        for node in level:
+            node.children = [Node() for _ in range(width)]
+            next_level.extend(node.children)
+        size += len(next_level)
+        level = next_level
+    return root, size
+
+
+def measure(search, root, breadth_first):
+    """Searches root for a node that is not there, returning the milliseconds
+    taken and the number of child lists enumerated."""
+
+    Node.listed = 0
+    start = time.time()
+    search(root, lambda node: False, breadth_first)
+    return (time.time() - start) * 1e3, Node.listed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the descendant searches of pyia2 against the recursive searches they replaced.")
+    parser.add_argument("--widths", default="10,20,40,80", help="comma separated children per node")
+    parser.add_argument("--depth", type=int, default=2, help="depth of the trees")
+    parser.add_argument("--cost-us", type=float, default=5.0, help="microseconds per child listed, 0 for none")
+    options = parser.parse_args()
+
+    Node.cost = options.cost_us / 1e6
+    print("%6s %7s  %-20s %-20s %-20s %-20s" % ("width", "nodes", "recursive bfs", "walk bfs",
+                                                "recursive dfs", "walk dfs"))
+    for width in [int(width) for width in options.widths.split(",")]:
+        root, size = build(width, options.depth)
+        cells = []
+        for breadth_first in (True, False):
+            for search in (find_descendant, walk.findDescendant):
+                cells.append("%8.1f ms %7d" % measure(search, root, breadth_first))
+        print("%6d %7d  %s" % (width, size, " ".join(cells)))
+    print("ms to search every node and child lists enumerated, with %g us per child listed" % options.cost_us)
+
+
+if __name__ == "__main__":
+    main()
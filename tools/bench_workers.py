@@ -0,0 +1,118 @@
+#!/usr/bin/env python27
+#
+# bench_workers
+# Times fetching the fields of an element one interface group per worker of
+# AttaWorkerPool against fetching them on one thread, with a fake backend
+# that spends a fixed time on every COM call
+#
+# Developed by Jon Gunderson, Mihir Kumar and Bei Zhang
+# Copyright (c) 2017 University of Illinois
+# Based on the ATTAs developed by Joanmarie Diggs (@joanmarie)
+#
+# For license information, see:
+# https://www.w3.org/Consortium/Legal/2008/04-testsuite-copyright.html
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from win_atta_workers import AttaWorkerPool, is_worth_splitting
+
+
+# As Atta.WORKER_SETUP_CALLS
+SETUP_CALLS = 3
+
+# The fields of pyia2.AccessibleElement by the interface they need, as
+# AccessibleElement.getFieldGroups() returns them with portable set, so
+# without the relations, which are always fetched on the request thread
+FIELD_GROUPS = [
+    ("IAccessible2", ["accName", "accValue", "accDescription", "accKeyboardShortcut",
+                      "states", "objectAttributes", "groupPosition"]),
+    ("IAccessibleText", ["textAttributes"]),
+    ("IAccessibleValue", ["ia2_value"]),
+    ("IAccessibleTableCell", ["columnExtent", "rowExtent"]),
+]
+
+
+class FakeBackend(object):
+    """Answers every COM call after latency seconds, sleeping as a thread
+    waiting on a cross-process COM call does, outside the GIL."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def call(self, *args):
+        time.sleep(self.latency)
+        return "%s:%s" % args
+
+    def fetch_group(self, name, fields, reacquire=False):
+        """Does what pyia2.fetchElementFields() does: on a worker, finds the
+        element again (AccessibleObjectFromEvent, QueryService for
+        IAccessible2 and its uniqueID), asks for the interface unless it is
+        IAccessible2, then fetches each field with one call."""
+
+        calls = SETUP_CALLS if reacquire else 0
+        if name != "IAccessible2":
+            calls += 1
+        for _ in range(calls):
+            time.sleep(self.latency)
+        return [(field, self.call(name, field)) for field in fields]
+
+
+def fetch_serial(backend, groups):
+    values = []
+    for name, fields in groups:
+        values.extend(backend.fetch_group(name, fields))
+    return values
+
+def fetch_pooled(backend, groups, pool):
+    values = []
+    for group_values in pool.map(lambda group: backend.fetch_group(group[0], group[1], True), groups):
+        values.extend(group_values)
+    return values
+
+
+def measure(fetch, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        values = fetch()
+    return (time.time() - start) * 1e3 / repeat, values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times fetching element fields on AttaWorkerPool workers against one thread, with a fake backend.")
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="milliseconds per COM call")
+    parser.add_argument("--workers", default="1,2,4,8", help="comma separated pool sizes")
+    parser.add_argument("--repeat", "-r", type=int, default=20, help="fetches per timing")
+    options = parser.parse_args()
+
+    backend = FakeBackend(options.latency_ms / 1e3)
+    cases = [
+        ("every field (dump)", FIELD_GROUPS),
+        ("states and textAttributes", [("IAccessible2", ["states"]), ("IAccessibleText", ["textAttributes"])]),
+    ]
+    sizes = [int(size) for size in options.workers.split(",")]
+
+    for name, groups in cases:
+        costs = [len(fields) + (group != "IAccessible2") for group, fields in groups]
+        print("%s, %d fields in %d groups, %g ms per call" % (name, sum(len(fields) for _, fields in groups),
+                                                              len(groups), options.latency_ms))
+        serial, expected = measure(lambda: fetch_serial(backend, groups), options.repeat)
+        print("  %-10s %8.1f ms" % ("serial", serial))
+        for size in sizes:
+            pool = AttaWorkerPool(size)
+            try:
+                pooled, values = measure(lambda: fetch_pooled(backend, groups, pool), options.repeat)
+            finally:
+                pool.close()
+            same = "same values" if values == expected else "DIFFERENT VALUES"
+            split = "split" if is_worth_splitting(costs, SETUP_CALLS, size) else "not split by the ATTA"
+            print("  %-10s %8.1f ms  %.2fx  %s, %s" % ("%d worker%s" % (size, "s" if size > 1 else ""),
+                                                       pooled, serial / pooled, same, split))
+
+
+if __name__ == "__main__":
+    main()
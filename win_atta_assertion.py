@@ -10,11 +10,16 @@
 # For license information, see:
 # https://www.w3.org/Consortium/Legal/2008/04-testsuite-copyright.html
 
+import bisect
+import collections
 import json
 import re
+import threading
+import time
 import traceback
 
 from textwrap import TextWrapper
+from win_atta_metrics import metrics
 
 
 class AttaAssertion(object):
@@ -41,28 +46,35 @@ class AttaAssertion(object):
     CLASS_RESULT = "result"
     CLASS_TBD = "TBD"
 
+    # Text logs are rendered for failures only unless more verbosity is asked for
+    VERBOSITY_FAILURES = 0
+    VERBOSITY_DETAILS = 1
+    VERBOSITY_ALL = 2
+
+    # Assertions that report information rather than check it always include details
+    always_details = False
+
     _text_wrapper = TextWrapper(width=80, break_on_hyphens=False, break_long_words=False)
     _labels = ["ASSERTION:", "STATUS:", "ACTUAL VALUE:", "MESSAGES:"]
 
-    def __init__(self, acc_elem, assertion, atta):
+    def __init__(self, acc_elem, assertion, atta, batch=None):
+        plan = assertion_compiler.compile(assertion)
+        self._plan = plan
         self._atta = atta
         self._acc_elem = acc_elem
-        self._as_string = " ".join(map(str, assertion))
-        self._test_class = assertion[0]
-        self._test_string = assertion[1]
-        self._expectation = assertion[2]
-        self._expected_value = assertion[3]
+        self._batch = batch
+        self._as_string = plan.as_string
+        self._test_class = plan.test_class
+        self._test_string = plan.test_string
+        self._expectation = plan.expectation
+        self._expected_value = plan.expected_value
+        if isinstance(self._expected_value, tuple):
+            self._expected_value = list(self._expected_value)
         self._actual_value = None
         self._messages = []
         self._status = self.STATUS_NOT_RUN
         self._bug = ""
 
-        # in some cases for MSAA there is more than one acceptable role value so convert to array
-        if self._expected_value.find("[") == 0 and self._expected_value.find("]"):
-            self._expected_value  = self._expected_value[1:]
-            self._expected_value  = self._expected_value[:-1]
-            self._expected_value = self._expected_value.split(",")
-
 
     @classmethod
     def get_test_class(cls, assertion):
@@ -106,57 +118,18 @@ class AttaAssertion(object):
         error = traceback.format_exc(limit=1, chain=False)
         self._messages.append(re.sub("\s+", " ", error))
 
-    def _compare(self, a, b):
-        if a == b:
-            return 0
-
-        try:
-            float_a = float(a)
-            float_b = float(b)
-        except:
-            return None
-
-        return min(max(float_a - float_b, -1), 1)
-
     def _get_result(self):
+        start_time = time.time()
         value = self._get_value()
-
-        self._actual_value_trimmed = False
+        evaluate_start = time.time()
+        metrics.add_phase("fetch", evaluate_start - start_time)
 
         if self._expectation == self.EXPECTATION_IS_TYPE:
             self._actual_value = self._atta.type_to_string(value)
         else:
             self._actual_value = value
-            if type(value) is unicode and value[-1:] == ' ':
-                self._actual_value_trimmed = value.strip()
-
-        if self._expectation == self.EXPECTATION_IS:
-            result = self._compare(self._actual_value, self._expected_value) == 0
-            if self._actual_value_trimmed:
-              result = result or self._compare(self._actual_value_trimmed, self._expected_value) == 0
-        elif self._expectation == self.EXPECTATION_IS_NOT:
-            result = self._compare(self._actual_value, self._expected_value) != 0
-        elif self._expectation == self.EXPECTATION_IS_LESS_THAN:
-            result = self._compare(self._actual_value, self._expected_value) == -1
-        elif self._expectation == self.EXPECTATION_IS_GREATER_THAN:
-            result = self._compare(self._actual_value, self._expected_value) == 1
-        elif self._expectation == self.EXPECTATION_IS_LESS_THAN_OR_EQUAL:
-            result = self._compare(self._actual_value, self._expected_value) in [0, -1]
-        elif self._expectation == self.EXPECTATION_IS_GREATER_THAN_OR_EQUAL:
-            result = self._compare(self._actual_value, self._expected_value) in [0, 1]
-        elif self._expectation == self.EXPECTATION_CONTAINS:
-            result = self._actual_value and self._expected_value in self._actual_value
-        elif self._expectation == self.EXPECTATION_DOES_NOT_CONTAIN:
-            result = isinstance(self._actual_value, list) \
-                     and self._expected_value not in self._actual_value
-        elif self._expectation == self.EXPECTATION_IS_ANY:
-            result = self._actual_value in self._expected_value
-        elif self._expectation == self.EXPECTATION_IS_TYPE:
-            result = self._actual_value == self._expected_value
-        elif self._expectation == self.EXPECTATION_EXISTS:
-            result = self._expected_value == self._actual_value
-        else:
-            result = False
+
+        result = self._plan.compare(self._actual_value, self._expected_value)
 
         if result:
             self._status = self.STATUS_PASS
@@ -168,6 +141,7 @@ class AttaAssertion(object):
 
 #        self._atta._print(self._atta.LOG_INFO, self._test_class + ' ' + self._test_string + ' ' + self._expectation + ' ' + str(self._expected_value) + ', ' + str(result))
 
+        metrics.add_phase("evaluate", time.time() - evaluate_start)
         return result
 
     def _get_value(self):
@@ -176,46 +150,452 @@ class AttaAssertion(object):
     def get_bug(self):
         return self._bug
 
-    def run(self):
+    def get_details(self):
+        """Returns the assertion, status, actual value and messages as a dict
+        that can be encoded as JSON without rendering the text log."""
+
+        actual_value = self._actual_value
+        if not isinstance(actual_value, (basestring, int, long, float, list, tuple, dict, type(None))):
+            actual_value = str(actual_value)
+
+        return {"assertion": self._as_string,
+                "status": self._status,
+                "actualValue": actual_value,
+                "messages": list(self._messages)}
+
+    def get_log(self, verbosity=VERBOSITY_FAILURES):
+        if self._status == self.STATUS_PASS and verbosity < self.VERBOSITY_ALL:
+            return ""
+
+        return str(self)
+
+    def run(self, verbosity=VERBOSITY_FAILURES):
         self._get_result()
-        return self._status, " ".join(self._messages), str(self)
+        return self._status, " ".join(self._messages), self.get_log(verbosity)
 
 
 
-class AttaEventAssertion(AttaAssertion):
+# What float() accepts, so numbers can be recognized without raising
+_number_pattern = re.compile(r"\s*[+-]?(?:(?:\d+\.?\d*|\.\d+)(?:e[+-]?\d+)?|inf(?:inity)?|nan)\s*\Z",
+                             re.IGNORECASE | re.UNICODE)
 
-    def __init__(self, obj, assertion, atta):
-        super(self.__class__, self).__init__(obj, assertion, atta)
 
-    def _get_result(self):
-#        result = self._expected_value in self._atta.get_event_history()
+def _to_number(value):
+    """Returns value as a float, or None if it isn't a number."""
+
+    if isinstance(value, (int, long, float)):
+        return float(value)
+
+    if isinstance(value, basestring) and _number_pattern.match(value):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    return None
+
+
+def _make_numeric_compare(number):
+    """Returns compare(a, e) -> 0, -1 or 1 (or a fraction between them for
+    close values), or None if a isn't a number, for an expected value of number."""
+
+    def compare(a, e):
+        if a == e:
+            return 0
+
+        value = _to_number(a)
+        if value is None:
+            return None
 
-        self._atta._print(self._atta.LOG_INFO, "[ASSERTION][AttaEventAssertion][_get_result][_expected_value]: " + str(self._expected_value))
-        self._atta._print(self._atta.LOG_INFO, "[ASSERTION][AttaEventAssertion][_get_result][events]:          " + str(self._atta._accessible_document.events))
+        return min(max(value - number, -1), 1)
 
-        result = self._expected_value in self._atta._accessible_document.events
+    return compare
 
-        self._atta._print(self._atta.LOG_INFO, "[ASSERTION][AttaEventAssertion][_get_result][result]:          " + str(result))
+
+def _is_equal(a, e):
+    return a == e
+
+
+def _is_equal_trimmed(a, e):
+    # Browsers sometimes leave a trailing space in names and descriptions
+    if a == e:
+        return True
+
+    if type(a) is unicode and a[-1:] == " ":
+        trimmed = a.strip()
+        return bool(trimmed) and trimmed == e
+
+    return False
+
+
+def _is_not_equal(a, e):
+    return not a == e
+
+
+def _never(a, e):
+    return False
+
+
+def _make_membership(members):
+    """Returns compare(a, e) testing a against the members of the list e."""
+
+    def is_any(a, e):
+        if isinstance(a, (list, dict, set)):
+            return a in e
+        return a in members
+
+    return is_any
+
+
+class AttaLRUCache(object):
+    """A thread-safe mapping that keeps the max_size most recently used entries."""
+
+    def __init__(self, max_size):
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        """Returns True if key is stored, without counting a lookup."""
+
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        """Returns the value stored for key, or None."""
+
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            if len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._entries),
+                    "maxSize": self._max_size,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hitRate": round(float(self.hits) / lookups, 3) if lookups else 0.0}
+
+
+AttaAssertionPlan = collections.namedtuple("AttaAssertionPlan", [
+    "as_string",        # assertion joined for logging
+    "test_class",       # "property", "event", "relation", "result" or "TBD"
+    "test_string",      # property, event, relation or method being tested
+    "expectation",
+    "expected_value",   # pre-parsed; "[a,b]" lists become tuples
+    "property",         # property fetched for property assertions, otherwise None
+    "compare",          # compare(actual_value, expected_value) -> result, picked for the expected value's type
+])
+
+
+class AttaAssertionCompiler(object):
+    """Turns harness assertions into immutable plans, memoized by content in
+    a bounded LRU cache since WPT sends the same assertions again and again."""
+
+    _comparators = {
+        AttaAssertion.EXPECTATION_CONTAINS: lambda a, e: a and e in a,
+        AttaAssertion.EXPECTATION_DOES_NOT_CONTAIN: lambda a, e: isinstance(a, list) and e not in a,
+        AttaAssertion.EXPECTATION_IS_ANY: lambda a, e: a in e,
+        AttaAssertion.EXPECTATION_IS_TYPE: _is_equal,
+        AttaAssertion.EXPECTATION_EXISTS: lambda a, e: e == a,
+    }
+
+    # Comparisons against a value that isn't a number can only succeed on equality
+    _string_comparators = {
+        AttaAssertion.EXPECTATION_IS: _is_equal_trimmed,
+        AttaAssertion.EXPECTATION_IS_NOT: _is_not_equal,
+        AttaAssertion.EXPECTATION_IS_LESS_THAN: _never,
+        AttaAssertion.EXPECTATION_IS_GREATER_THAN: _never,
+        AttaAssertion.EXPECTATION_IS_LESS_THAN_OR_EQUAL: _is_equal,
+        AttaAssertion.EXPECTATION_IS_GREATER_THAN_OR_EQUAL: _is_equal,
+    }
+
+    # Applied to the result of _make_numeric_compare()
+    _numeric_comparators = {
+        AttaAssertion.EXPECTATION_IS: lambda result: result == 0,
+        AttaAssertion.EXPECTATION_IS_NOT: lambda result: result != 0,
+        AttaAssertion.EXPECTATION_IS_LESS_THAN: lambda result: result == -1,
+        AttaAssertion.EXPECTATION_IS_GREATER_THAN: lambda result: result == 1,
+        AttaAssertion.EXPECTATION_IS_LESS_THAN_OR_EQUAL: lambda result: result in (0, -1),
+        AttaAssertion.EXPECTATION_IS_GREATER_THAN_OR_EQUAL: lambda result: result in (0, 1),
+    }
+
+    def __init__(self, max_size=2048):
+        self._plans = AttaLRUCache(max_size)
+
+    @staticmethod
+    def key(assertion):
+        """Returns a hashable key identifying assertion by content."""
+
+        key = tuple(assertion)
+        try:
+            hash(key)
+        except TypeError:
+            # e.g. combined event assertions carry a dict of properties
+            key = json.dumps(assertion, sort_keys=True)
+        return key
+
+    def compile(self, assertion):
+        """Returns the plan for assertion, compiling it on a cache miss."""
+
+        key = self.key(assertion)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = self._compile(assertion)
+            self._plans.put(key, plan)
+
+        return plan
+
+    def _compile(self, assertion):
+        test_class, test_string, expectation, expected_value = assertion[:4]
+        expected_value = self._parse_expected_value(test_class, expected_value)
+        as_string = " ".join(map(str, assertion))
+
+        if test_class == AttaAssertion.CLASS_PROPERTY:
+            property_name = test_string
+        else:
+            property_name = None
+
+        if test_class == AttaAssertion.CLASS_EVENT:
+            compare = self._compile_event_matcher(test_string, expectation, expected_value)
+            as_string = "%s %s" % (test_class, compare)
+        else:
+            compare = self._get_comparator(expectation, expected_value)
+
+        return AttaAssertionPlan(as_string=as_string,
+                                 test_class=test_class,
+                                 test_string=test_string,
+                                 expectation=expectation,
+                                 expected_value=expected_value,
+                                 property=property_name,
+                                 compare=compare)
+
+    def _parse_expected_value(self, test_class, expected_value):
+        # in some cases for MSAA there is more than one acceptable role value so convert to array
+        if isinstance(expected_value, basestring):
+            if expected_value.startswith("[") and expected_value.endswith("]"):
+                expected_value = tuple(expected_value[1:-1].split(","))
+            elif expected_value == "<nil>" and test_class == AttaAssertion.CLASS_PROPERTY:
+                expected_value = "None"
+
+        return expected_value
+
+    def _compile_event_matcher(self, test_string, expectation, expected_value):
+        """Returns an AttaEventMatcher for an event assertion, which is either
+        a single check or the checks combined by Atta._create_platform_assertions."""
+
+        if isinstance(expected_value, list):
+            checks = expected_value
+        else:
+            checks = [(test_string, expectation, expected_value)]
+
+        compiled = []
+        for name, check_expectation, check_value in checks:
+            check_value = self._parse_expected_value(AttaAssertion.CLASS_EVENT, check_value)
+            compiled.append((name, check_expectation, check_value,
+                             self._get_comparator(check_expectation, check_value)))
+
+        return AttaEventMatcher(compiled)
+
+    def _get_comparator(self, expectation, expected_value):
+        """Returns the compare function specialized for the type of expected_value."""
+
+        if expectation == AttaAssertion.EXPECTATION_IS_ANY and isinstance(expected_value, tuple):
+            return _make_membership(frozenset(expected_value))
+
+        check = self._numeric_comparators.get(expectation)
+        if check is not None:
+            number = _to_number(expected_value)
+            if number is None:
+                return self._string_comparators[expectation]
+
+            compare = _make_numeric_compare(number)
+            return lambda a, e: check(compare(a, e))
+
+        return self._comparators.get(expectation, _never)
+
+    def get_stats(self):
+        return self._plans.get_stats()
+
+
+# Shared by all assertions so plans survive across requests
+assertion_compiler = AttaAssertionCompiler()
+
+
+class AttaPropertyBatch(object):
+    """Property values shared by the assertions of one request, so each
+    distinct (element, property) is fetched once however many assertions
+    check it."""
+
+    def __init__(self, atta):
+        self._atta = atta
+        self._values = {}
+        self.requested = 0
+        self.fetched = 0
+
+    def _fetch(self, acc_elem, property_name):
+        try:
+            return self._atta.get_property_value(acc_elem, property_name), None
+        except Exception as exception:
+            return None, exception
+
+    def get(self, acc_elem, property_name):
+        self.requested += 1
+        key = id(acc_elem), property_name
+        try:
+            value, error = self._values[key]
+        except KeyError:
+            self.fetched += 1
+            value, error = self._values[key] = self._fetch(acc_elem, property_name)
+
+        if error is not None:
+            raise error
+
+        return value
+
+
+class AttaEventMatcher(object):
+    """The event checks of a test compiled into a single all-or-nothing match.
+
+    Checks are grouped into steps, a new step starting whenever a field is
+    checked again, e.g. a second "type". Each step must be satisfied by one
+    event, and the events matching consecutive steps must occur in order.
+    The history is scanned forward once, only visiting events of the expected
+    type when a step checks the type for equality."""
+
+    # Names used by harness assertions for fields of AttaEventRecord
+    FIELD_ALIASES = {"source": "id"}
+
+    def __init__(self, checks):
+        self.steps = []
+        step = []
+        for name, expectation, expected_value, compare in checks:
+            field = self.FIELD_ALIASES.get(name, name)
+            if field in [check[0] for check in step]:
+                self.steps.append(self._make_step(step))
+                step = []
+            if isinstance(expected_value, tuple):
+                expected_value = list(expected_value)
+            step.append((field, name, expectation, expected_value, compare))
+
+        if step:
+            self.steps.append(self._make_step(step))
+
+    @staticmethod
+    def _make_step(checks):
+        type_name = None
+        for field, name, expectation, expected_value, compare in checks:
+            if field == "type" and expectation == AttaAssertion.EXPECTATION_IS \
+                    and isinstance(expected_value, basestring):
+                type_name = expected_value
+
+        return type_name, tuple(checks)
+
+    @staticmethod
+    def describe_step(step):
+        type_name, checks = step
+        return ", ".join("%s %s %s" % (name, expectation, expected_value)
+                         for field, name, expectation, expected_value, compare in checks)
+
+    def __str__(self):
+        return "; then ".join(map(self.describe_step, self.steps))
+
+    def match(self, history):
+        """Returns the records of the events matching each step in order,
+        stopping at the first step that no later event matches."""
+
+        events, positions, count = history.snapshot()
+        matched = []
+        last = -1
+        for type_name, checks in self.steps:
+            if type_name is not None:
+                candidates = positions.get(type_name, ())
+                candidates = candidates[bisect.bisect_right(candidates, last):]
+            else:
+                candidates = xrange(last + 1, count)
+
+            position = None
+            for candidate in candidates:
+                if candidate >= count:
+                    break
+                record = events[candidate]
+                if all(compare(record.get(field), expected_value)
+                       for field, name, expectation, expected_value, compare in checks):
+                    position = candidate
+                    break
+
+            if position is None:
+                break
+
+            matched.append(events[position])
+            last = position
+
+        return matched
+
+
+class AttaEventAssertion(AttaAssertion):
+
+    def __init__(self, obj, assertion, atta, **kwargs):
+        super(self.__class__, self).__init__(obj, assertion, atta, **kwargs)
+
+    def _get_result(self):
+        start_time = time.time()
+        matcher = self._plan.compare
+        matched = matcher.match(self._atta.get_event_history())
+        result = len(matched) == len(matcher.steps)
 
         if result:
+            self._actual_value = [record.type for record in matched]
             self._status = self.STATUS_PASS
-            return True
+        else:
+            self._actual_value = self._atta.get_event_history().get_type_names()
+            self._status = self.STATUS_FAIL
+            message = "No event matching %s" % matcher.describe_step(matcher.steps[len(matched)])
+            if matched:
+                message += " after %s" % matched[-1].type
+            self._messages.append(message)
+            self._bug = self._atta.get_bug(self._as_string, self._expected_value, self._actual_value)
+            if self._bug:
+                self._messages.append(self._bug)
 
-        self._status = self.STATUS_FAIL
-        return False
+        self._atta._print(self._atta.LOG_DEBUG, "[ASSERTION][AttaEventAssertion][_get_result]: %s %s"
+                          % (self._as_string, self._status))
+
+        metrics.add_phase("evaluate", time.time() - start_time)
+        return result
 
 
 class AttaPropertyAssertion(AttaAssertion):
 
-    def __init__(self, acc_elem, assertion, atta):
+    def __init__(self, acc_elem, assertion, atta, **kwargs):
 
-        super(self.__class__, self).__init__(acc_elem, assertion, atta)
-        if self._expected_value == "<nil>":
-            self._expected_value = "None"
+        super(self.__class__, self).__init__(acc_elem, assertion, atta, **kwargs)
 
     def _get_value(self):
         try:
-            value = self._atta.get_property_value(self._acc_elem, self._test_string)
+            if self._batch is not None:
+                value = self._batch.get(self._acc_elem, self._test_string)
+            else:
+                value = self._atta.get_property_value(self._acc_elem, self._test_string)
         except Exception as error:
             self._messages.append("[ASSERTION][AttaPropertyAssertion]ERROR: %s" % error)
             return None
@@ -225,9 +605,13 @@ class AttaPropertyAssertion(AttaAssertion):
 
 class AttaRelationAssertion(AttaAssertion):
 
-    def __init__(self, acc_elem, assertion, atta):
-        super(self.__class__, self).__init__(acc_elem, assertion, atta)
-        self._relation_type = atta.string_to_value(self._test_string)
+    def __init__(self, acc_elem, assertion, atta, **kwargs):
+        super(self.__class__, self).__init__(acc_elem, assertion, atta, **kwargs)
+        self._relation_type = self._test_string
+
+        # "[label1 label2]" and "[label1,label2]" both list the expected target ids
+        if isinstance(self._expected_value, list):
+            self._expected_value = [id for value in self._expected_value for id in value.split()]
 
     def _get_value(self):
         try:
@@ -236,13 +620,13 @@ class AttaRelationAssertion(AttaAssertion):
             self._messages.append("[ASSERTION][AttaRelationAssertion]ERROR: %s" % error)
             return None
 
-        return "[%s]" % " ".join(self._atta.value_to_string(targets))
+        return targets
 
 
 class AttaResultAssertion(AttaAssertion):
 
-    def __init__(self, acc_elem, assertion, atta):
-        super(self.__class__, self).__init__(acc_elem, assertion, atta)
+    def __init__(self, acc_elem, assertion, atta, **kwargs):
+        super(self.__class__, self).__init__(acc_elem, assertion, atta, **kwargs)
         self._method = None
         self._args = []
 
@@ -266,29 +650,19 @@ class AttaResultAssertion(AttaAssertion):
 
 
 class AttaDumpInfoAssertion(AttaAssertion):
+    """Reports everything known about an element, to help author tests."""
 
-    def __init__(self, acc_elem, assertion, atta):
-        assertion = [""] * 4
-        super(AttaDumpInfoAssertion, self).__init__(acc_elem, assertion, atta)
-
-    def run(self):
-        info = dict.fromkeys(["properties", "relation targets", "supported methods"])
+    always_details = True
 
-        properties = self._atta.get_supported_properties(self._obj)
-        getter = lambda x: self._atta.get_property_value(self._obj, x)
-        info["properties"] = {prop: getter(prop) for prop in properties}
-
-        info["actions"] = self._atta.get_supported_actions(self._obj)
-
-        relation_types = self._atta.get_supported_relation_types(self._obj)
-        getter = lambda x: self._atta.get_relation_targets(self._obj, x)
-        info["relation targets"] = {rtype: getter(rtype) for rtype in relation_types}
+    def __init__(self, acc_elem, assertion, atta, **kwargs):
+        assertion = [""] * 4
+        super(AttaDumpInfoAssertion, self).__init__(acc_elem, assertion, atta, **kwargs)
 
-        supported_methods = self._atta.get_supported_methods(self._obj)
-        methods = list(map(self._atta.value_to_string, supported_methods.values()))
-        info["supported methods"] = sorted(methods)
+    def run(self, verbosity=AttaAssertion.VERBOSITY_FAILURES):
+        start_time = time.time()
+        self._actual_value = self._atta.get_element_info(self._acc_elem)
+        metrics.add_phase("fetch", time.time() - start_time)
 
-        info = self._atta.value_to_string(info)
-        log = json.dumps(info, indent=4, sort_keys=True)
+        log = json.dumps(self._actual_value, indent=4, sort_keys=True, default=str)
         self._status = self.STATUS_FAIL
         return self._status, " ".join(self._messages), log
@@ -12,20 +12,38 @@
 
 import argparse
 import faulthandler
+import os
 import signal
 import sys
 import threading
+import time
 import traceback
 
 from urlparse import urlparse
 
 from BaseHTTPServer import HTTPServer
-from win_atta_assertion import AttaAssertion
+from SocketServer import ThreadingMixIn
+from win_atta_assertion import AttaAssertion, AttaAssertionCompiler, AttaLRUCache, \
+    AttaPropertyAssertion, AttaPropertyBatch, assertion_compiler
+from win_atta_event_history import AttaEventHistory, AttaEventRecord
+from win_atta_event_stream import event_stream
+from win_atta_manifest import AttaManifest
+from win_atta_metrics import metrics
+from win_atta_properties import atta_properties
+from win_atta_results import AttaResultStore
+from win_atta_workers import AttaWorkerPool, is_worth_splitting
 from win_atta_request_handler import AttaRequestHandler
 
 import pyia2
 
 
+class AttaHTTPServer(ThreadingMixIn, HTTPServer):
+    """Handles each request on its own thread so event streams don't block
+    tests. AttaRequestHandler runs the other requests one at a time."""
+
+    daemon_threads = True
+
+
 class Atta(object):
     """Optional base class for python27 Accessible Technology Test Adapters."""
 
@@ -63,6 +81,38 @@ class Atta(object):
     FORMAT_WARNING = "\x1b[33;1m%(label)s\x1b[22m%(msg)s\x1b[0m"
     FORMAT_BAD = "\x1b[31;1m%(label)s\x1b[22m%(msg)s\x1b[0m"
 
+    LOG_VERBOSITY = {
+        "failures": AttaAssertion.VERBOSITY_FAILURES,
+        "details": AttaAssertion.VERBOSITY_DETAILS,
+        "all": AttaAssertion.VERBOSITY_ALL,
+    }
+
+    # Events used to track the loaded document, also published to event streams
+    LOAD_EVENT_TYPES = (
+        pyia2.EVENT_OBJECT_FOCUS,
+        pyia2.EVENT_OBJECT_STATECHANGE,
+        pyia2.EVENT_OBJECT_SELECTION,
+        pyia2.EVENT_OBJECT_SELECTIONREMOVE,
+        pyia2.EVENT_OBJECT_NAMECHANGE,
+        pyia2.EVENT_OBJECT_DESCRIPTIONCHANGE,
+        pyia2.IA2_EVENT_DOCUMENT_LOAD_COMPLETE,
+        pyia2.IA2_EVENT_ACTIVE_DESCENDANT_CHANGED,
+        pyia2.IA2_EVENT_OBJECT_ATTRIBUTE_CHANGED,
+    )
+
+    # COM calls a worker makes to find an element again before fetching its
+    # fields: AccessibleObjectFromEvent, then its IAccessible2 and uniqueID
+    WORKER_SETUP_CALLS = 3
+
+    # Events after which the cached text attribute runs of their source are stale
+    TEXT_EVENT_TYPES = (
+        pyia2.IA2_EVENT_TEXT_ATTRIBUTE_CHANGED,
+        pyia2.IA2_EVENT_TEXT_CHANGED,
+        pyia2.IA2_EVENT_TEXT_INSERTED,
+        pyia2.IA2_EVENT_TEXT_REMOVED,
+        pyia2.IA2_EVENT_TEXT_UPDATED,
+    )
+
     def __init__(self, host, port, name, version, api, log_level=None):
         """Initializes this ATTA."""
 
@@ -83,25 +133,17 @@ class Atta(object):
         #self._interfaces = list(filter(lambda x: gir.find_by_name("Atk", x), ifaces))
         # TODO: self._interfaces neede?
 
-        self._supported_properties = {
-            "accessible": lambda x: x is not None,
-            "childCount": pyia2.get_child_count,
-            "description": pyia2.get_description,
-            "name": pyia2.get_name,
-#            "interfaces": pyia2.get_interfaces,
-            "objectAttributes": pyia2.get_ia2_attribute_set,
-            "parent": pyia2.get_parent,
-            "relations": pyia2.get_ia2_relation_set,
-            "role": pyia2.get_ia2_role,
-            "type": pyia2.get_type_set,
-            "interfaces": pyia2.get_interface_set,
-            "states": pyia2.get_ia2_state_set,
-        }
-
         self._log_level = log_level or self.LOG_DEBUG
         self._host = host
         self._port = int(port)
         self._ansi_formatting = True
+        self._pretty_json = False
+        self._log_verbosity = AttaAssertion.VERBOSITY_FAILURES
+        self._results_file = None
+        self._results_exported = 0
+        self._worker_pool = None
+        self._manifest = None
+        self._full_walk = False
 
         self._server = None
         self._server_thread = None
@@ -113,13 +155,15 @@ class Atta(object):
         self._ready = False
         self._next_test = None, ""
 
-        self._results = {}
+        self._results = AttaResultStore()
+        self._result_cache = AttaLRUCache(4096)
         self._monitored_event_types = []
-        self._event_history = []
+        self._event_history = AttaEventHistory(self._get_event_source_id)
         self._listeners = {}
 
         # Information from IAccessible
         self._accessible_document = None
+        self._current_document = None
         self._current_uri = ""
 
         if not sys.version_info[0] == 2:
@@ -147,16 +191,10 @@ class Atta(object):
         if not self._enabled:
             return
 
-        self._register_listener(pyia2.EVENT_OBJECT_FOCUS, atta._on_load_complete)
-        self._register_listener(pyia2.EVENT_OBJECT_STATECHANGE, atta._on_load_complete)
-        self._register_listener(pyia2.EVENT_OBJECT_SELECTION, atta._on_load_complete)
-        self._register_listener(pyia2.EVENT_OBJECT_SELECTIONREMOVE, atta._on_load_complete)
-        self._register_listener(pyia2.EVENT_OBJECT_NAMECHANGE, atta._on_load_complete)
-        self._register_listener(pyia2.EVENT_OBJECT_DESCRIPTIONCHANGE, atta._on_load_complete)
-
-        self._register_listener(pyia2.IA2_EVENT_DOCUMENT_LOAD_COMPLETE, atta._on_load_complete)
-        self._register_listener(pyia2.IA2_EVENT_ACTIVE_DESCENDANT_CHANGED, atta._on_load_complete)
-        self._register_listener(pyia2.IA2_EVENT_OBJECT_ATTRIBUTE_CHANGED, atta._on_load_complete)
+        for event_type in self.LOAD_EVENT_TYPES:
+            self._register_listener(event_type, atta._on_load_complete)
+        for event_type in self.TEXT_EVENT_TYPES:
+            self._register_listener(event_type, atta._on_text_changed)
 
         self._print(self.LOG_INFO,"[WIN_ATTA_BASE][start]")
 
@@ -170,9 +208,26 @@ class Atta(object):
 
 
         self._print(self.LOG_INFO, "Starting server on http://%s:%s/" % (self._host, self._port))
-        self._server = HTTPServer((self._host, self._port), AttaRequestHandler)
+        self._server = AttaHTTPServer((self._host, self._port), AttaRequestHandler)
 
         AttaRequestHandler.set_atta(self)
+        AttaRequestHandler.set_pretty_json(kwargs.get("pretty_json", self._pretty_json))
+        self._log_verbosity = self.LOG_VERBOSITY.get(kwargs.get("log_verbosity"), self._log_verbosity)
+        self._results_file = kwargs.get("results_file") or self._results_file
+
+        workers = int(kwargs.get("workers") or 0)
+        if workers > 0 and self._worker_pool is None:
+            self._worker_pool = AttaWorkerPool(workers, pyia2.com_coinitialize, pyia2.com_couninitialize)
+            self._print(self.LOG_INFO, "Fetching element fields on %d worker threads" % workers)
+
+        self._full_walk = bool(kwargs.get("full_walk", self._full_walk))
+        manifest = kwargs.get("manifest")
+        if manifest and self._manifest is None:
+            try:
+                self._manifest = AttaManifest.load(manifest)
+                self._print(self.LOG_INFO, "Loaded the targets of %d tests from %s" % (len(self._manifest), manifest))
+            except Exception:
+                self._print(self.LOG_ERROR, "Could not load manifest %s: %s" % (manifest, self._on_exception()))
 
 
         if self._server_thread is None:
@@ -189,6 +244,25 @@ class Atta(object):
                 "API": self._api_name,
                 "APIversion": self._api_version}
 
+    def get_metrics(self, **kwargs):
+        """Returns a dict of run-time counters and timings for the /metrics endpoint."""
+
+        snapshot = metrics.snapshot()
+        snapshot["counters"].update(pyia2.counters.snapshot())
+        snapshot["assertionPlans"] = assertion_compiler.get_stats()
+        snapshot["resultCache"] = self._result_cache.get_stats()
+        snapshot["results"] = self._results.get_stats()
+        snapshot["workers"] = self._worker_pool.get_stats() if self._worker_pool else None
+        snapshot["manifest"] = self._manifest.get_stats() if self._manifest else None
+        document = self._accessible_document
+        snapshot["lastWalk"] = document.walk_stats if document else None
+        return snapshot
+
+    def get_results(self, **kwargs):
+        """Returns the AttaResultStore holding the result of every assertion run."""
+
+        return self._results
+
     def is_enabled(self, **kwargs):
         """Returns True if this ATTA is enabled."""
 
@@ -229,44 +303,152 @@ class Atta(object):
     def end_test_run(self, **kwargs):
         """Cleans up cached information at the end of a test run."""
 
+        summary = metrics.phase_summary(metrics.end_run())
+        if summary:
+            self._print(self.LOG_INFO, "[TIMING] %s" % summary)
+
+        if self._results_file:
+            self._export_results(self._results_file)
+
         self._accessible_document = None
+        self._current_document = None
         self._next_test = None, ""
         self._ready = False
 
 
+    def _export_results(self, path, **kwargs):
+        """Appends the results added since the last export to path, as CSV if
+        its name ends with .csv and as newline delimited JSON otherwise."""
+
+        csv_format = path.lower().endswith(".csv")
+        try:
+            header = not os.path.exists(path) or not os.path.getsize(path)
+            with open(path, "ab") as stream:
+                self._results_exported = self._results.export(stream,
+                                                              "csv" if csv_format else "ndjson",
+                                                              start=self._results_exported,
+                                                              header=header)
+        except (IOError, OSError):
+            self._print(self.LOG_ERROR, "[BASE][_export_results]" + self._on_exception())
+
     def run_tests(self, obj_id, assertions):
         """Runs the assertions on the object with the specified id, returning
         a dict with the results, the status of the run, and any messages."""
 
+        response, results = self.iter_tests(obj_id, assertions)
+        response["results"] = list(results)
+        return response
+
+    def iter_tests(self, obj_id, assertions):
+        """Like run_tests(), but returns the dict without results together with
+        an iterator producing each result dict as its assertion is run."""
+
         if not self.is_enabled():
             return {"status": self.STATUS_ERROR,
-                    "message": self.FAILURE_ATTA_NOT_ENABLED,
-                    "results": []}
+                    "message": self.FAILURE_ATTA_NOT_ENABLED}, iter([])
 
         if not self.is_ready():
             return {"status": self.STATUS_ERROR,
-                    "message": self.QURE_ATTA_NOT_READY,
-                    "results": []}
+                    "message": self.FAILURE_ATTA_NOT_READY}, iter([])
 
         to_run = self._create_platform_assertions(assertions)
 
-        acc_elem = self._get_accessible_element_with_id(self._accessible_document, obj_id)
+        # Read before the lookup so results are never cached under a newer generation
+        document = self._accessible_document
+        generation = document.generation
+
+        start_time = time.time()
+        acc_elem = self._get_accessible_element_with_id(document, obj_id)
+        metrics.add_phase("lookup", time.time() - start_time)
 
         if not acc_elem:
             return {"status": self.STATUS_ERROR,
-                    "message": self.FAILURE_ELEMENT_NOT_FOUND,
-                    "results": []}
+                    "message": self.FAILURE_ELEMENT_NOT_FOUND}, iter([])
+
+        return {"status": self.STATUS_OK}, self._run_batch(acc_elem, to_run,
+                                                           document=document,
+                                                           generation=generation)
+
+    def _run_batch(self, acc_elem, assertions, **kwargs):
+        """Runs the assertions in order, yielding each result dict. The fields
+        of acc_elem they check are fetched first in a single pass, and
+        assertions checking the same property share a single fetch."""
+
+        batch = AttaPropertyBatch(self)
+        plan = self._plan_fetches(acc_elem, assertions, **kwargs)
+        self._print(self.LOG_DEBUG, "[BASE][_run_batch][plan] %s" % plan)
+
+        if plan.fields or plan.probe:
+            start_time = time.time()
+            if plan.probe:
+                # Every interface is asked for once, so loading the fields reuses them
+                acc_elem.getInterfaces()
+            self._load_fields(acc_elem, plan.fields, plan.interfaces)
+            metrics.add_phase("fetch", time.time() - start_time)
+
+        for assertion in assertions:
+            yield self._run_test(acc_elem, assertion, batch=batch, **kwargs)
+
+        metrics.increment("property_fetches_requested", batch.requested)
+        metrics.increment("property_fetches", batch.fetched)
+        self._print(self.LOG_DEBUG, "[BASE][_run_batch] %d property fetches for %d property assertions"
+                    % (batch.fetched, batch.requested))
+
+    def _load_fields(self, acc_elem, fields=None, interfaces=(), **kwargs):
+        """Loads the given fields of acc_elem, or all of them. With a worker
+        pool, the fields needing each interface are fetched concurrently, one
+        group per worker, each finding the element again by its window and
+        uniqueID so no COM pointer crosses threads. They are stored in group
+        order once all are back. Groups are only split when that should beat
+        fetching them here, counting a call per field and per interface asked
+        for. Fields holding COM pointers, and any a worker could not fetch,
+        are then loaded on this thread."""
+
+        pool = self._worker_pool
+        if pool is not None:
+            groups = acc_elem.getFieldGroups(fields, interfaces, portable=True)
+            costs = [len(group) + (name != "IAccessible2") for name, group in groups]
+            if is_worth_splitting(costs, self.WORKER_SETUP_CALLS, pool.size):
+                locator = acc_elem.getLocator()
+            else:
+                locator = None
+            if locator is not None:
+                try:
+                    fetched = pool.map(lambda group: pyia2.fetchElementFields(locator, *group), groups)
+                except Exception:
+                    self._print(self.LOG_ERROR, "[BASE][_load_fields]" + self._on_exception())
+                    fetched = []
+
+                for values in fetched:
+                    if values is not None:
+                        acc_elem.storeFields(values)
+                metrics.increment("parallel_fetches", len(groups))
+
+        acc_elem.load(fields, interfaces)
 
-        results = [self._run_test(acc_elem, a) for a in to_run]
+    def _plan_fetches(self, acc_elem, assertions, **kwargs):
+        """Returns the AttaFetchPlan of the properties checked by assertions
+        whose results are not cached."""
 
-        return {"status": self.STATUS_OK,
-                "results": results}
+        property_names = []
+        for assertion in assertions:
+            test_class = self._get_assertion_test_class(assertion)
+            if test_class is not AttaPropertyAssertion:
+                continue
+
+            cache_key = self._get_result_cache_key(acc_elem, assertion, test_class, **kwargs)
+            if cache_key and cache_key in self._result_cache:
+                continue
+
+            property_names.append(assertion_compiler.compile(assertion).property)
+
+        return atta_properties.plan(property_names)
 
     def start_listen(self, event_types, **kwargs):
         """Causes the ATTA to start listening for the specified events."""
 
         self._monitored_event_types = []
-        self._event_history = []
+        self._event_history.clear()
 
         for event_type in event_types:
             self._register_listener(event_type, self._on_test_event, **kwargs)
@@ -279,19 +461,19 @@ class Atta(object):
             self._deregister_listener(event_type, self._on_test_event, **kwargs)
 
         self._monitored_event_types = []
-        self._event_history = []
+        self._event_history.clear()
+
+    def get_event_history(self, **kwargs):
+        """Returns the AttaEventHistory of events seen since listening started."""
+
+        return self._event_history
 
     def shutdown(self, atta, signum=None, frame=None, **kwargs):
         """Shuts down this ATTA (i.e. after all tests have been run)."""
-        self._deregister_listener(pyia2.EVENT_OBJECT_FOCUS, atta._on_load_complete)
-        self._deregister_listener(pyia2.EVENT_OBJECT_STATECHANGE, atta._on_load_complete)
-        self._deregister_listener(pyia2.EVENT_OBJECT_SELECTION, atta._on_load_complete)
-        self._deregister_listener(pyia2.EVENT_OBJECT_SELECTIONREMOVE, atta._on_load_complete)
-        self._deregister_listener(pyia2.EVENT_OBJECT_NAMECHANGE, atta._on_load_complete)
-        self._deregister_listener(pyia2.EVENT_OBJECT_DESCRIPTIONCHANGE, atta._on_load_complete)
-        self._deregister_listener(pyia2.IA2_EVENT_DOCUMENT_LOAD_COMPLETE, atta._on_load_complete)
-        self._deregister_listener(pyia2.IA2_EVENT_ACTIVE_DESCENDANT_CHANGED, atta._on_load_complete)
-        self._deregister_listener(pyia2.IA2_EVENT_OBJECT_ATTRIBUTE_CHANGED, atta._on_load_complete)
+        for event_type in self.LOAD_EVENT_TYPES:
+            self._deregister_listener(event_type, atta._on_load_complete)
+        for event_type in self.TEXT_EVENT_TYPES:
+            self._deregister_listener(event_type, atta._on_text_changed)
 
         if not self._enabled:
             return
@@ -306,17 +488,51 @@ class Atta(object):
             signal_string = ""
         self._print(self.LOG_INFO, "Shutting down server %s" % signal_string)
 
+        summary = metrics.phase_summary()
+        if summary:
+            self._print(self.LOG_INFO, "[TIMING] all runs: %s" % summary)
+
         if self._server is not None:
             thread = threading.Thread(target=self._server.shutdown)
             thread.start()
 
+        if self._worker_pool is not None:
+            self._worker_pool.close()
+            self._worker_pool = None
+
     def get_relation_targets(self, obj, relation_type, **kwargs):
-        """Returns the elements of pointed to by relation_type for obj."""
+        """Returns the ids of the elements pointed to by relation_type for obj,
+        given as an IA2 relation type (e.g. labelledBy) or its name (e.g.
+        IA2_RELATION_LABELLED_BY)."""
 
         if not obj:
             raise AttributeError("Object not found")
 
-        self._print(self.LOG_DEBUG, "get_relation_targets() not implemented")
+        relation_name = self._get_relation_name(relation_type)
+        obj.load(("ia2_relations",))
+        targets = pyia2.get_ia2_relation_targets(obj.ao, self._get_target_id_getter(),
+                                                 relation_types=(relation_name,),
+                                                 relations=obj.ia2_relations)
+        return targets.get(relation_name, [])
+
+    @staticmethod
+    def _get_relation_name(relation_type):
+        """Returns the name of relation_type, e.g. IA2_RELATION_LABELLED_BY for labelledBy."""
+
+        name = pyia2.UNLOCALIZED_IA2_RELATION_TYPES.get(relation_type, relation_type)
+        # The IA2 headers spell it both ways
+        if name == "IA2_RELATION_LABELED_BY":
+            name = "IA2_RELATION_LABELLED_BY"
+        return name
+
+    def _get_target_id_getter(self, **kwargs):
+        """Returns a function mapping relation targets to element ids, through
+        the uniqueID index of the current document when there is one."""
+
+        if self._accessible_document is not None:
+            return self._accessible_document.getTargetId
+
+        return None
 
     def _get_rendering_engine(self, **kwargs):
         """Returns a string with details of the user agent's rendering engine."""
@@ -329,11 +545,7 @@ class Atta(object):
         if not element_id:
             return None
 
-        for elem in accessible_document.test_elements:
-            if elem.test_id == element_id:
-                return elem
-
-        return None
+        return accessible_document.getElementById(element_id)
 
     def _get_id(self, obj, **kwargs):
         """Returns the element id associated with obj or an empty string upon failure."""
@@ -368,51 +580,59 @@ class Atta(object):
 
         return children
 
+    def get_element_info(self, acc_elem, **kwargs):
+        """Returns a dict with the id, supported property values, interfaces and
+        relation targets of acc_elem. Every field of acc_elem not fetched yet is
+        fetched first in a single pass, and the relation targets are resolved
+        from the relations it fetched."""
+
+        self._load_fields(acc_elem)
+        info = {"id": acc_elem.test_id, "properties": {}, "relationTargets": {}}
+        for property_name in atta_properties.names():
+            info["properties"][property_name] = self.get_property_value(acc_elem, property_name)
+        info["interfaces"] = info["properties"]["interfaces"]
+
+        if acc_elem.relations and acc_elem.ao is not None:
+            try:
+                info["relationTargets"] = pyia2.get_ia2_relation_targets(acc_elem.ao,
+                                                                         self._get_target_id_getter(),
+                                                                         relations=acc_elem.ia2_relations)
+            except:
+                self._print(self.LOG_ERROR, "[BASE][get_element_info]" + self._on_exception())
+
+        return info
+
+    def get_text_attributes(self, acc_elem, offset=pyia2.IA2_TEXT_OFFSET_LENGTH, **kwargs):
+        """Returns the text attributes of acc_elem at offset as 'name:value'
+        strings; the textAttributes(offset) property. Offsets other than
+        IA2_TEXT_OFFSET_LENGTH are answered from the runs cached for the
+        current document, which text events drop."""
+
+        if not acc_elem:
+            raise AttributeError("Object not found")
+
+        text = acc_elem.queryInterface("IAccessibleText")
+        if text is None:
+            return []
+
+        document = self._accessible_document
+        cache = document.text_attributes if document is not None else None
+        return pyia2.get_ia2_text_attribute_set(text, offset, cache, acc_elem.unique_id)
+
     def get_property_value(self, acc_elem, property_name, **kwargs):
         """Returns the value of property_name for obj."""
 
         if not acc_elem and property_name != "accessible":
             raise AttributeError("Object not found")
 
-        try:
-            if property_name == 'role':
-                if self._api_name == 'IAccessible2':
-                    value =  acc_elem.ia2_role
-                else:
-                    value =  acc_elem.role
-            if property_name == 'accName':
-                value =  acc_elem.accName
-            if property_name == 'accValue':
-                value =  acc_elem.accValue
-            if property_name == 'accDescription':
-                value =  acc_elem.accDescription
-            if property_name == 'objectAttributes':
-                value =  acc_elem.objectAttributes
-            if property_name == 'textAttributes':
-                value =  acc_elem.textAttributes
-            if property_name == 'states':
-                value =  acc_elem.states
-            if property_name == 'relations':
-                value =  acc_elem.relations
-            if property_name == 'interfaces':
-                value =  acc_elem.interfaces
-            if property_name == 'minimumValue':
-                value =  acc_elem.ia2_value_min
-            if property_name == 'currentValue':
-                value =  acc_elem.ia2_value_current
-            if property_name == 'maximumValue':
-                value =  acc_elem.ia2_value_max
-            if property_name == 'groupPosition':
-                value =  acc_elem.groupPosition
-            if property_name == 'localizedExtendedRole':
-                value =  acc_elem.localizedExtendedRole
-            if property_name == 'accKeyboardShortcut':
-                value =  acc_elem.accKeyboardShortcut
-            if property_name == 'columnExtent':
-                value =  acc_elem.columnExtent
-            if property_name == 'rowExtent':
-                value =  acc_elem.rowExtent
+        prop = atta_properties.get(property_name)
+        if prop is None:
+            raise AttributeError("Unsupported property: %s" % property_name)
 
+        try:
+            if prop.field is not None and acc_elem:
+                acc_elem.load((prop.field,))
+            value = prop.getter(self, acc_elem)
         except:
             self._print(self.LOG_ERROR, "[BASE][get_property_value][except]" + self._on_exception())
             value = []
@@ -434,35 +654,15 @@ class Atta(object):
 
         return ""
 
-    def _on_test_event(self, data, **kwargs):
-        """Callback for platform accessibility events the ATTA is testing."""
-
-#        try:
-#            pyia2.com_coinitialize()
-#        except:
-#            print('[IA2][_on_test_event]: error cointializing')
-
-        if not self._in_current_document(data.source):
-            return
-
-        event_as_dict = {
-            "obj": data.source,
-            "type": data.type,
-            "detail1": data.detail1,
-            "detail2": data.detail2,
-            "any_data": data.any_data
-        }
-
-        self._event_history.append(event_as_dict)
-
     def _in_current_document(self, obj, **kwargs):
         """Returns True if obj is an element in the current test's document."""
 
-        if not self._current_document:
+        document = self._current_document
+        if not document or obj is None:
             return False
 
-        pred = lambda x: x == self._current_document
-        return self._find_ancestor(obj, pred, **kwargs) is not None
+        pred = lambda x: x == document
+        return pred(obj) or self._find_ancestor(obj, pred, **kwargs) is not None
 
     def _find_ancestor(self, obj, pred, **kwargs):
         """Returns the ancestor of obj for which pred returns True."""
@@ -528,56 +728,62 @@ class Atta(object):
     def _create_platform_assertions(self, assertions, **kwargs):
         """Performs platform-specific changes needed to harness assertions."""
 
-        is_event = lambda x: x and x[0] == "event"
+        is_event = lambda x: x and x[0] == AttaAssertion.CLASS_EVENT
         event_assertions = list(filter(is_event, assertions))
-        # We don't need these event assertions so always return assertions
-        return assertions
-
         if not event_assertions:
             return assertions
 
-        platform_assertions = list(filter(lambda x: x not in event_assertions, assertions))
+        platform_assertions = [x for x in assertions if not is_event(x)]
 
         # The properties associated with accessible events are currently given to
         # us as individual subtests. Unlike other assertions, event properties are
         # not independent of one another. Because these should be tested as an all-
-        # or-nothing assertion, we'll combine the subtest values into a dictionary
-        # passed along with each subtest.
-        properties = {}
-        for test, name, verb, value in event_assertions:
-            properties[name] = value
-
-        combined_event_assertions = ["event", "event", "contains", properties]
+        # or-nothing assertion, we'll combine the subtests, in order, into a single
+        # assertion that is matched against the event history as a whole.
+        checks = [list(x[1:4]) for x in event_assertions]
+        combined_event_assertions = [AttaAssertion.CLASS_EVENT, "event", AttaAssertion.EXPECTATION_CONTAINS, checks]
         platform_assertions.append(combined_event_assertions)
         return platform_assertions
 
+    def _get_result_cache_key(self, acc_elem, assertion, test_class, document=None, generation=None, **kwargs):
+        """Returns the key under which the result of assertion is cached, or None
+        if it can't be. Only property assertions are cached, since their values
+        come from the document snapshot identified by its generation."""
+
+        if document is None or generation is None or test_class is not AttaPropertyAssertion:
+            return None
+
+        return (document.uri, acc_elem.test_id, AttaAssertionCompiler.key(assertion),
+                generation, self._log_verbosity)
+
     def _run_test(self, acc_elem, assertion, **kwargs):
         """Runs a single assertion on accessible element object, returning a results dict."""
 
         bug = ""
+        details = None
         test_class = self._get_assertion_test_class(assertion)
+        cache_key = self._get_result_cache_key(acc_elem, assertion, test_class, **kwargs)
+        cached = cache_key and self._result_cache.get(cache_key)
 
-        if test_class is None:
+        if cached:
+            result, message, log, details, bug = cached
+        elif test_class is None:
             result = AttaAssertion.STATUS_FAIL
             message = "ERROR: %s is not a valid assertion" % assertion
             log = message
         else:
-            test = test_class(acc_elem, assertion, self)
-            result, message, log = test.run()
+            test = test_class(acc_elem, assertion, self, batch=kwargs.get("batch"))
+            result, message, log = test.run(self._log_verbosity)
             if result == AttaAssertion.STATUS_FAIL:
                 bug = test.get_bug()
+            if self._log_verbosity >= AttaAssertion.VERBOSITY_DETAILS or test.always_details:
+                details = test.get_details()
+            if cache_key:
+                self._result_cache.put(cache_key, (result, message, log, details, bug))
 
         test_file = urlparse(self._next_test[1]).path
-
-        status_results = self._results.get(bug or result, {})
-
-        file_results = status_results.get(test_file, [])
-
-        file_results.append(" ".join(map(str, assertion)))
-
-        status_results[test_file] = file_results
-
-        self._results[bug or result] = status_results
+        string = " ".join(map(str, assertion))
+        self._results.add(self._next_test[0], test_file, string, bug or result)
 
         if not self._ansi_formatting:
             formatting = self.FORMAT_NONE
@@ -593,7 +799,6 @@ class Atta(object):
         else:
             formatting = self.FORMAT_WARNING
 
-        string = " ".join(map(str, assertion))
         if message:
             string = "%s %s" % (string, message)
 
@@ -602,6 +807,9 @@ class Atta(object):
         else:
             self._print(self.LOG_RESULT_FAIL, "%s" % string)
 
+        if details is not None:
+            return {"result": result, "message": message, "log": log, "details": details}
+
         return {"result": result, "message": message, "log": log}
 
 
@@ -634,33 +842,115 @@ class Atta(object):
 
 #        self._print(self.LOG_INFO, "[BASE][_on_load_complete][event.type]" + str(event.type))
 
+        metrics.increment("events_processed")
+        if event_stream.has_subscribers():
+            self._publish_event(event)
+
         if event.type == pyia2.IA2_EVENT_DOCUMENT_LOAD_COMPLETE:
             ao = pyia2.accessibleObjectFromEvent(event)
-            self._accessible_document = pyia2.AccessibleDocument(ao)
+            self._accessible_document = pyia2.AccessibleDocument(ao,
+                                                                 target_fields=self._get_target_fields(ao),
+                                                                 targeted=not self._full_walk)
+            self._current_document = ao
         else:
             if self._accessible_document:
+                self._accessible_document.invalidate()
                 if self._accessible_document.addEvent(event.type):
 #                    self._print(self.LOG_INFO, "[BASE][_on_load_complete][events]" + str(self._accessible_document.events))
                     self._accessible_document.updateTestElements()
 
+    def _get_target_fields(self, ao):
+        """Returns the fields to fetch for each element the test in document ao
+        is known from the manifest to check, by id, or None if it is unknown.
+        The document then only searches for those elements."""
+
+        if self._manifest is None:
+            return None
+
+        targets = self._manifest.get(pyia2.get_value(ao), self._api_name)
+        if not targets:
+            metrics.increment("manifest_misses")
+            return None
+
+        metrics.increment("manifest_prefetches", len(targets))
+        return dict((element_id, atta_properties.plan(property_names).fields)
+                    for element_id, property_names in targets.items())
+
+    def _on_text_changed(self, event):
+        """Callback for changes to the text or text attributes of an object."""
+
+        document = self._accessible_document
+        if document is None:
+            return
+
+        try:
+            unique_id = pyia2.get_unique_id(event.source)
+        except:
+            # Without knowing the object, forget the runs of all of them
+            unique_id = None
+        document.textChanged(unique_id)
+
     def _on_test_event(self, data, **kwargs):
         """Callback for platform accessibility events the ATTA is testing."""
-        if not self._in_current_document(data.source):
-            return
+        metrics.increment("events_processed")
+
+        # Events tracking the document were already published by _on_load_complete
+        if data.type not in self.LOAD_EVENT_TYPES and event_stream.has_subscribers():
+            self._publish_event(data)
+
+        if self._in_current_document(data.source):
+            # Whatever the event, cached results may no longer hold
+            document = self._accessible_document
+            if document is not None:
+                document.invalidate()
+            self._record_event(data)
+
+    def _record_event(self, event):
+        """Adds event to the history checked by event assertions."""
+
+        self._event_history.add(pyia2.UNLOCALIZED_EVENT_NAMES.get(event.type, str(event.type)), event)
+
+    def _get_event_source_id(self, event):
+        """Returns the element id of the source of event or an empty string upon failure."""
+
+        try:
+            return self._get_id(event.source)
+        except:
+            return ""
+
+    def _publish_event(self, event):
+        """Sends event to the subscribers of the event stream. The id of its
+        source is looked up by the subscribers, not on the thread delivering
+        events."""
+
+        document = self._accessible_document
+        record = AttaEventRecord(pyia2.UNLOCALIZED_EVENT_NAMES.get(event.type, str(event.type)),
+                                 event, self._get_event_source_id)
+        event_stream.publish(record, document.uri if document else "")
+
+    def open_event_stream(self, **kwargs):
+        """Returns a subscriber to the event stream with the filters given as
+        keyword arguments, for the current thread to consume. The thread is
+        initialized for COM, since consuming events looks up their sources."""
+
+        pyia2.com_coinitialize()
+        return event_stream.subscribe(**kwargs)
 
-        event_as_dict = {
-            "obj": data.source,
-            "type": data.type,
-            "detail1": data.detail1,
-            "detail2": data.detail2,
-            "any_data": data.any_data
-        }
+    def close_event_stream(self, subscriber, **kwargs):
+        """Ends the subscription of open_event_stream() on the current thread."""
 
-        self._event_history.append(event_as_dict)
+        event_stream.unsubscribe(subscriber)
+        pyia2.com_couninitialize()
 
 def get_cmdline_options():
     parser = argparse.ArgumentParser()
     parser.add_argument("--host", action="store")
     parser.add_argument("--port", action="store")
     parser.add_argument("--ansi-formatting", action="store_true")
+    parser.add_argument("--pretty-json", action="store_true")
+    parser.add_argument("--log-verbosity", choices=["failures", "details", "all"], default="failures")
+    parser.add_argument("--results-file", action="store")
+    parser.add_argument("--workers", action="store", type=int, default=0)
+    parser.add_argument("--manifest", action="store")
+    parser.add_argument("--full-walk", action="store_true")
     return vars(parser.parse_args())
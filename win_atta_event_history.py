@@ -0,0 +1,104 @@
+#!/usr/bin/env python27
+#
+# win_atta_event_history
+# Indexed history of accessibility events for Accessible Technology Test Adapters
+#
+# Developed by Jon Gunderson, Mihir Kumar and Bei Zhang
+# Copyright (c) 2017 University of Illinois
+# Based on the ATTAs developed by Joanmarie Diggs (@joanmarie)
+#
+# For license information, see:
+# https://www.w3.org/Consortium/Legal/2008/04-testsuite-copyright.html
+
+import threading
+
+
+class AttaEventRecord(object):
+    """An event in the history. The id of its source is only looked up when an
+    assertion asks for it, since that takes several COM calls."""
+
+    __slots__ = ("type", "event", "_get_id", "_id")
+
+    # Attributes of pyia2 events that assertions can match besides type and id
+    EVENT_FIELDS = ("object_id", "child_id", "hwnd", "thread_id", "timestamp")
+
+    def __init__(self, type_name, event, get_id):
+        self.type = type_name
+        self.event = event
+        self._get_id = get_id
+        self._id = None
+
+    def get(self, field):
+        """Returns the value of field for this event, or None if it has no such field."""
+
+        if field == "type":
+            return self.type
+
+        if field == "id":
+            if self._id is None:
+                try:
+                    self._id = self._get_id(self.event)
+                except Exception:
+                    self._id = ""
+            return self._id
+
+        if field in self.EVENT_FIELDS:
+            return getattr(self.event, field, None)
+
+        return None
+
+
+class AttaEventHistory(object):
+    """The events seen since the ATTA started listening, in order and indexed
+    by type so assertions only visit the events that can match them."""
+
+    def __init__(self, get_id, max_events=4096):
+        self._lock = threading.Lock()
+        self._get_id = get_id
+        self._max_events = max_events
+        # Replaced rather than mutated on clear or trim so snapshots stay valid
+        self._events = []
+        self._positions = {}
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def add(self, type_name, event):
+        with self._lock:
+            if len(self._events) >= self._max_events:
+                self._trim()
+
+            self._positions.setdefault(type_name, []).append(len(self._events))
+            self._events.append(AttaEventRecord(type_name, event, self._get_id))
+
+    def _trim(self):
+        """Drops the older half of the events."""
+
+        kept = self._events[len(self._events) // 2:]
+        self.dropped += len(self._events) - len(kept)
+
+        positions = {}
+        for position, record in enumerate(kept):
+            positions.setdefault(record.type, []).append(position)
+
+        self._events = kept
+        self._positions = positions
+
+    def clear(self):
+        with self._lock:
+            self._events = []
+            self._positions = {}
+
+    def snapshot(self):
+        """Returns the events, the positions of each type and the number of
+        events, which stay consistent while new events arrive."""
+
+        with self._lock:
+            return self._events, self._positions, len(self._events)
+
+    def get_type_names(self):
+        """Returns the distinct event types in the order they were first seen."""
+
+        events, positions, count = self.snapshot()
+        return sorted(positions, key=lambda type_name: positions[type_name][0])
@@ -0,0 +1,111 @@
+#!/usr/bin/env python27
+#
+# win_atta_event_stream
+# Real-time accessibility event streaming for Accessible Technology Test Adapters
+#
+# Developed by Jon Gunderson, Mihir Kumar and Bei Zhang
+# Copyright (c) 2017 University of Illinois
+# Based on the ATTAs developed by Joanmarie Diggs (@joanmarie)
+#
+# For license information, see:
+# https://www.w3.org/Consortium/Legal/2008/04-testsuite-copyright.html
+
+import Queue
+import threading
+import time
+
+from win_atta_metrics import metrics
+
+
+class AttaEventSubscriber(object):
+    """A consumer of the event stream with its own filters and bounded queue.
+
+    Events are queued as AttaEventRecord with the URI of the document they
+    were seen in. Only the type filter is applied when they are queued, on
+    the thread delivering events; the id of their source takes COM calls, so
+    it is looked up, and the other filters applied, by the consumer."""
+
+    def __init__(self, types=None, ids=None, documents=None, max_pending=256):
+        self._queue = Queue.Queue(max_pending)
+        self.types = frozenset(types or [])
+        self.ids = frozenset(ids or [])
+        self.documents = tuple(documents or [])
+        self.dropped = 0
+
+    def matches(self, record, document):
+        if self.documents:
+            uri = document or ""
+            if not any(uri.endswith(filter_document) for filter_document in self.documents):
+                return False
+
+        if self.ids and record.get("id") not in self.ids:
+            return False
+
+        return True
+
+    def offer(self, record, document):
+        """Queues record if it has a wanted type, dropping it when the consumer is behind."""
+
+        if self.types and record.type not in self.types:
+            return
+
+        try:
+            self._queue.put_nowait((record, document))
+        except Queue.Full:
+            self.dropped += 1
+            metrics.increment("stream_events_dropped")
+
+    def get(self, timeout):
+        """Returns the next event passing the filters as a dict, or None if
+        none arrived within timeout seconds."""
+
+        deadline = time.time() + timeout
+        while True:
+            try:
+                record, document = self._queue.get(True, max(deadline - time.time(), 0))
+            except Queue.Empty:
+                return None
+
+            if self.matches(record, document):
+                return {"type": record.type,
+                        "id": record.get("id"),
+                        "document": document,
+                        "timestamp": record.get("timestamp")}
+
+
+class AttaEventBroadcaster(object):
+    """Fans accessibility events out to stream subscribers without blocking the caller."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Replaced rather than mutated so publish() can read it without locking
+        self._subscribers = ()
+
+    def subscribe(self, **kwargs):
+        subscriber = AttaEventSubscriber(**kwargs)
+        with self._lock:
+            self._subscribers = self._subscribers + (subscriber,)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers if s is not subscriber)
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def publish(self, record, document=""):
+        """Offers record, an AttaEventRecord seen in the document with URI
+        document, to the subscribers."""
+
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+
+        metrics.increment("stream_events_published")
+        for subscriber in subscribers:
+            subscriber.offer(record, document)
+
+
+# Shared by the request handler and the ATTA
+event_stream = AttaEventBroadcaster()
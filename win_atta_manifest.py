@@ -0,0 +1,171 @@
+#!/usr/bin/env python27
+#
+# win_atta_manifest
+# Index of the elements and properties checked by each WPT test for Accessible Technology Test Adapters
+#
+# Developed by Jon Gunderson, Mihir Kumar and Bei Zhang
+# Copyright (c) 2017 University of Illinois
+# Based on the ATTAs developed by Joanmarie Diggs (@joanmarie)
+#
+# For license information, see:
+# https://www.w3.org/Consortium/Legal/2008/04-testsuite-copyright.html
+
+import argparse
+import json
+import os
+import re
+
+from urlparse import urlparse
+
+
+class AttaManifest(object):
+    """The element ids each test checks and the properties checked on each, by
+    test path and API, so an ATTA can fetch them as soon as a document loads.
+
+    Tests are keyed by their path from the root they were found under, e.g.
+    /wai-aria/role/button-manual.html, and looked up by the path of their URL
+    or its longest suffix found, so the root does not have to match where the
+    tests are served from."""
+
+    VERSION = 1
+
+    TEST_EXTENSIONS = (".html", ".htm", ".xhtml")
+
+    _attacomm_pattern = re.compile(r"new\s+ATTAcomm\s*\(")
+
+    def __init__(self):
+        # {path: {api: {id: (property, ...)}}}
+        self._tests = {}
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self._tests)
+
+    def add(self, path, api, element_id, property_name):
+        properties = self._tests.setdefault(path, {}).setdefault(api, {}).setdefault(element_id, ())
+        if property_name not in properties:
+            self._tests[path][api][element_id] = properties + (property_name,)
+
+    def get(self, url, api):
+        """Returns {id: (property, ...)} for the test at url and api, or None if
+        the test is not in the manifest."""
+
+        path = urlparse(url or "").path
+        while path:
+            tests = self._tests.get(path)
+            if tests is not None:
+                return tests.get(api, {})
+
+            # Try again without the first directory
+            slash = path.find("/", 1)
+            path = path[slash:] if slash > 0 else ""
+
+        return None
+
+    @classmethod
+    def compile(cls, roots):
+        """Returns the manifest of the tests in the files under roots."""
+
+        manifest = cls()
+        for root in roots:
+            for directory, directories, files in os.walk(root):
+                directories.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(cls.TEST_EXTENSIONS):
+                        file_path = os.path.join(directory, name)
+                        path = "/" + os.path.relpath(file_path, root).replace(os.sep, "/")
+                        manifest.add_file(path, file_path)
+        return manifest
+
+    def add_file(self, path, file_path):
+        """Adds the assertions of the ATTAcomm tests in the file at file_path."""
+
+        with open(file_path, "rb") as stream:
+            source = stream.read().decode("utf-8", "replace")
+
+        decoder = json.JSONDecoder()
+        for match in self._attacomm_pattern.finditer(source):
+            start = source.find("{", match.end())
+            try:
+                test, end = decoder.raw_decode(source, start)
+            except ValueError:
+                # Hand written tests may hold JavaScript rather than JSON
+                self.skipped += 1
+                continue
+            self._add_test(path, test)
+
+    def _add_test(self, path, test):
+        for step in test.get("steps", []):
+            if step.get("type") != "test" or not isinstance(step.get("test"), dict):
+                continue
+
+            element_id = step.get("element")
+            for api, assertions in step["test"].items():
+                for assertion in assertions:
+                    property_name = self._get_property_name(assertion)
+                    if property_name is not None:
+                        self.add(path, api, element_id, property_name)
+
+    @staticmethod
+    def _get_property_name(assertion):
+        """Returns the property of the element an assertion checks, if any."""
+
+        if not isinstance(assertion, list) or len(assertion) < 2:
+            return None
+
+        if assertion[0] == "property":
+            return assertion[1]
+
+        if assertion[0] == "relation":
+            return "relations"
+
+        return None
+
+    def save(self, path):
+        """Writes the manifest to path as compact JSON, with each property name
+        stored once and referred to by its index."""
+
+        names = sorted(set(name for apis in self._tests.values() for ids in apis.values()
+                           for properties in ids.values() for name in properties))
+        indexes = dict((name, index) for index, name in enumerate(names))
+        tests = {}
+        for test_path, apis in self._tests.items():
+            tests[test_path] = dict((api, dict((element_id, [indexes[name] for name in properties])
+                                               for element_id, properties in ids.items()))
+                                    for api, ids in apis.items())
+
+        with open(path, "wb") as stream:
+            json.dump({"version": self.VERSION, "properties": names, "tests": tests}, stream,
+                      separators=(",", ":"), sort_keys=True)
+
+    @classmethod
+    def load(cls, path):
+        """Returns the manifest saved at path."""
+
+        with open(path, "rb") as stream:
+            data = json.load(stream)
+
+        if data.get("version") != cls.VERSION:
+            raise ValueError("Unsupported manifest version: %s" % data.get("version"))
+
+        manifest = cls()
+        names = data["properties"]
+        for test_path, apis in data["tests"].items():
+            manifest._tests[test_path] = dict((api, dict((element_id, tuple(names[index] for index in properties))
+                                                         for element_id, properties in ids.items()))
+                                              for api, ids in apis.items())
+        return manifest
+
+    def get_stats(self):
+        return {"tests": len(self._tests)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compiles the manifest of the WPT tests under the given directories.")
+    parser.add_argument("roots", nargs="+", help="directories holding tests, e.g. a web-platform-tests checkout")
+    parser.add_argument("--output", "-o", default="manifest.json")
+    options = parser.parse_args()
+
+    manifest = AttaManifest.compile(options.roots)
+    manifest.save(options.output)
+    print("%d tests written to %s, %d scripts skipped" % (len(manifest), options.output, manifest.skipped))
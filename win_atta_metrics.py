@@ -0,0 +1,193 @@
+#!/usr/bin/env python27
+#
+# win_atta_metrics
+# Run-time counters and latency histograms for Accessible Technology Test Adapters
+#
+# Developed by Jon Gunderson, Mihir Kumar and Bei Zhang
+# Copyright (c) 2017 University of Illinois
+# Based on the ATTAs developed by Joanmarie Diggs (@joanmarie)
+#
+# For license information, see:
+# https://www.w3.org/Consortium/Legal/2008/04-testsuite-copyright.html
+
+import bisect
+import threading
+import time
+
+
+class AttaHistogram(object):
+    """Fixed-bucket histogram of durations in milliseconds."""
+
+    BOUNDS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self):
+        self._buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self._buckets[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """Returns the upper bound of the bucket holding the given percentile."""
+
+        if not self.count:
+            return 0.0
+
+        rank = self.count * percent / 100.0
+        seen = 0
+        for index, bucket in enumerate(self._buckets):
+            seen += bucket
+            if seen >= rank and bucket:
+                if index < len(self.BOUNDS):
+                    return min(self.BOUNDS[index], self.max)
+                break
+
+        return self.max
+
+    def to_dict(self):
+        return {"count": self.count,
+                "mean": round(self.total / self.count, 3) if self.count else 0.0,
+                "max": round(self.max, 3),
+                "p50": round(self.percentile(50), 3),
+                "p90": round(self.percentile(90), 3),
+                "p99": round(self.percentile(99), 3)}
+
+
+class AttaRequestTimer(object):
+    """Accumulates the seconds spent in each phase of a single request."""
+
+    PHASES = ("parse", "ready", "lookup", "fetch", "evaluate", "encode", "compress", "write")
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.phases = {}
+
+    def add(self, phase, elapsed):
+        self.phases[phase] = self.phases.get(phase, 0.0) + elapsed
+
+    def server_timing(self):
+        """Returns the phases formatted for a Server-Timing header."""
+
+        return ", ".join("%s;dur=%.3f" % (phase, self.phases[phase] * 1000)
+                         for phase in self.PHASES if phase in self.phases)
+
+
+class AttaMetrics(object):
+    """Thread-safe counters and histograms scraped through the /metrics endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._start_time = time.time()
+        self._counters = {}
+        self._histograms = {}
+        self._requests = {}
+        self._run_phases = {}
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = AttaHistogram()
+            histogram.record(value)
+
+    def observe_request(self, endpoint, value):
+        with self._lock:
+            histogram = self._requests.get(endpoint)
+            if histogram is None:
+                histogram = self._requests[endpoint] = AttaHistogram()
+            histogram.record(value)
+
+    def begin_request(self, endpoint):
+        """Starts timing the phases of a request handled on the current thread."""
+
+        timer = AttaRequestTimer(endpoint)
+        self._local.timer = timer
+        return timer
+
+    def current_request(self):
+        return getattr(self._local, "timer", None)
+
+    def add_phase(self, phase, elapsed):
+        """Adds elapsed seconds to phase of the current thread's request, if any."""
+
+        timer = getattr(self._local, "timer", None)
+        if timer is not None:
+            timer.add(phase, elapsed)
+
+    def end_request(self):
+        """Folds the current request's phase timings into the histograms."""
+
+        timer = getattr(self._local, "timer", None)
+        self._local.timer = None
+        if timer is None:
+            return None
+
+        with self._lock:
+            for phase, elapsed in timer.phases.items():
+                name = "%s.%s" % (timer.endpoint, phase)
+                histogram = self._histograms.get(name)
+                if histogram is None:
+                    histogram = self._histograms[name] = AttaHistogram()
+                histogram.record(elapsed * 1000)
+                self._run_phases[phase] = self._run_phases.get(phase, 0.0) + elapsed
+
+        return timer
+
+    def end_run(self):
+        """Returns the seconds spent per phase since the last call and starts over."""
+
+        with self._lock:
+            phases = self._run_phases
+            self._run_phases = {}
+        return phases
+
+    def phase_summary(self, phases=None):
+        """Returns a one line summary of per phase times in milliseconds."""
+
+        if phases is None:
+            with self._lock:
+                phases = {}
+                for name, histogram in self._histograms.items():
+                    phase = name.rsplit(".", 1)[-1]
+                    if phase in AttaRequestTimer.PHASES:
+                        phases[phase] = phases.get(phase, 0.0) + histogram.total / 1000
+
+        total = sum(phases.values()) or 1.0
+        return ", ".join("%s %.1f ms (%d%%)" % (phase, phases[phase] * 1000, 100 * phases[phase] / total)
+                         for phase in AttaRequestTimer.PHASES if phase in phases)
+
+    def get_counter(self, name):
+        return self._counters.get(name, 0)
+
+    def uptime(self):
+        return time.time() - self._start_time
+
+    def reset(self):
+        with self._lock:
+            self._start_time = time.time()
+            self._counters = {}
+            self._histograms = {}
+            self._requests = {}
+            self._run_phases = {}
+
+    def snapshot(self):
+        with self._lock:
+            return {"uptime": round(self.uptime(), 3),
+                    "counters": dict(self._counters),
+                    "timings": dict((k, v.to_dict()) for k, v in self._histograms.items()),
+                    "requests": dict((k, v.to_dict()) for k, v in self._requests.items())}
+
+
+# Shared by the request handler and the ATTA
+metrics = AttaMetrics()
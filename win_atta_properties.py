@@ -0,0 +1,196 @@
+#!/usr/bin/env python27
+#
+# win_atta_properties
+# Registry of the element properties Accessible Technology Test Adapters can check
+#
+# Developed by Jon Gunderson, Mihir Kumar and Bei Zhang
+# Copyright (c) 2017 University of Illinois
+# Based on the ATTAs developed by Joanmarie Diggs (@joanmarie)
+#
+# For license information, see:
+# https://www.w3.org/Consortium/Legal/2008/04-testsuite-copyright.html
+
+import collections
+import re
+
+
+class AttaProperty(object):
+    """A property assertions can check: getter(atta, acc_elem) returns its
+    value, interface names the IA2 interface it needs, if any, cost says what
+    fetching it takes and field names the field of the element that must be
+    loaded first, if any."""
+
+    __slots__ = ("name", "getter", "interface", "cost", "field")
+
+    # Read when the element was collected
+    COST_SNAPSHOT = "snapshot"
+    # A field of the element, fetched by AccessibleElement.load() with the
+    # other fields of a plan and kept until the element is collected again
+    COST_FIELD = "field"
+    # Asks for every interface of the element, each only the first time
+    COST_PROBE = "probe"
+    # Makes COM calls through its interface whenever its value is not cached
+    COST_CALL = "call"
+
+    def __init__(self, name, getter, interface=None, cost=COST_FIELD, field=None):
+        self.name = name
+        self.getter = getter
+        self.interface = interface
+        self.cost = cost
+        self.field = field
+
+
+class AttaFetchPlan(object):
+    """What fetching a list of properties of an element takes: the interfaces
+    to ask for, in order, then the properties and element fields to fetch.
+
+    Properties are ordered by cost. Snapshot properties need nothing fetched.
+    Field properties come next, those needing no interface first, then those
+    of the IAccessible2 every element is collected through, then those of
+    each other interface together, so each interface is asked for once.
+    Probe properties come after them, with probe set so the interfaces they
+    ask for can be resolved before the fields are loaded. Call properties
+    come last, their interfaces after those of the fields."""
+
+    def __init__(self, registry, property_names):
+        self.interfaces = []
+        self.properties = []
+        self.fields = []
+        self.probe = False
+        self.unsupported = []
+
+        snapshots = []
+        groups = collections.OrderedDict([(None, []), ("IAccessible2", [])])
+        probes = []
+        calls = []
+        for name in property_names:
+            prop = registry.get(name)
+            if prop is None:
+                if name not in self.unsupported:
+                    self.unsupported.append(name)
+                continue
+
+            if prop.cost == AttaProperty.COST_SNAPSHOT:
+                props = snapshots
+            elif prop.cost == AttaProperty.COST_PROBE:
+                props = probes
+            elif prop.cost == AttaProperty.COST_CALL:
+                props = calls
+            else:
+                props = groups.setdefault(prop.interface, [])
+            if prop.name not in [other.name for other in props]:
+                props.append(prop)
+
+        self.properties.extend(prop.name for prop in snapshots)
+        for interface, props in groups.items():
+            if interface is not None and props:
+                self.interfaces.append(interface)
+            for prop in props:
+                self.properties.append(prop.name)
+                if prop.field is not None and prop.field not in self.fields:
+                    self.fields.append(prop.field)
+
+        self.probe = bool(probes)
+        self.properties.extend(prop.name for prop in probes)
+        for prop in calls:
+            if prop.interface is not None and prop.interface not in self.interfaces:
+                self.interfaces.append(prop.interface)
+            self.properties.append(prop.name)
+
+    def __str__(self):
+        plan = "interfaces [%s] properties [%s]" % (", ".join(self.interfaces), ", ".join(self.properties))
+        if self.probe:
+            plan += " probe"
+        if self.unsupported:
+            plan += " unsupported [%s]" % ", ".join(self.unsupported)
+        return plan
+
+
+class AttaPropertyRegistry(object):
+    """Maps property names to AttaProperty. ATTAs add their own properties
+    with register() rather than by overriding get_property_value().
+
+    Properties taking an index, e.g. an offset into the text of the element,
+    are added with register_indexed() and checked as name(index), e.g.
+    textAttributes(5)."""
+
+    _indexed_pattern = re.compile(r"^(\w+)\((-?\d+)\)$")
+
+    def __init__(self):
+        self._properties = collections.OrderedDict()
+        self._indexed = {}
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def register(self, name, getter, interface=None, cost=AttaProperty.COST_FIELD, field=None):
+        """Adds property name, replacing any property of that name."""
+
+        self._properties[name] = AttaProperty(name, getter, interface, cost, field)
+
+    def attribute(self, name, attribute=None, interface=None):
+        """Adds property name answered by a field of the element, by default
+        the field of the same name."""
+
+        attribute = attribute or name
+        self.register(name, lambda atta, acc_elem: getattr(acc_elem, attribute), interface,
+                      field=attribute)
+
+    def register_indexed(self, name, getter, interface=None, cost=AttaProperty.COST_CALL):
+        """Adds property name(index), answered by getter(atta, acc_elem, index)."""
+
+        self._indexed[name] = getter, interface, cost
+
+    def get(self, name):
+        """Returns the AttaProperty called name, or None if it is not supported."""
+
+        prop = self._properties.get(name)
+        if prop is not None:
+            return prop
+
+        match = self._indexed_pattern.match(name or "")
+        if match is None or match.group(1) not in self._indexed:
+            return None
+
+        getter, interface, cost = self._indexed[match.group(1)]
+        index = int(match.group(2))
+        return AttaProperty(name, lambda atta, acc_elem: getter(atta, acc_elem, index), interface, cost)
+
+    def names(self):
+        return list(self._properties)
+
+    def plan(self, names):
+        """Returns the AttaFetchPlan of the properties called names."""
+
+        return AttaFetchPlan(self, names)
+
+
+def _get_role(atta, acc_elem):
+    if atta._api_name == "IAccessible2":
+        return acc_elem.ia2_role
+    return acc_elem.role
+
+
+# Shared by all ATTAs; the properties of pyia2.AccessibleElement
+atta_properties = AttaPropertyRegistry()
+atta_properties.register("role", _get_role, "IAccessible2", AttaProperty.COST_SNAPSHOT)
+atta_properties.attribute("accName")
+atta_properties.attribute("accValue")
+atta_properties.attribute("accDescription")
+atta_properties.attribute("objectAttributes", interface="IAccessible2")
+atta_properties.attribute("textAttributes", interface="IAccessibleText")
+atta_properties.register_indexed("textAttributes",
+                                 lambda atta, acc_elem, offset: atta.get_text_attributes(acc_elem, offset),
+                                 "IAccessibleText")
+atta_properties.attribute("states", interface="IAccessible2")
+atta_properties.attribute("relations", interface="IAccessible2")
+atta_properties.register("interfaces", lambda atta, acc_elem: acc_elem.getInterfaces(),
+                         cost=AttaProperty.COST_PROBE)
+atta_properties.attribute("minimumValue", "ia2_value_min", "IAccessibleValue")
+atta_properties.attribute("currentValue", "ia2_value_current", "IAccessibleValue")
+atta_properties.attribute("maximumValue", "ia2_value_max", "IAccessibleValue")
+atta_properties.attribute("groupPosition", interface="IAccessible2")
+atta_properties.attribute("localizedExtendedRole", interface="IAccessible2")
+atta_properties.attribute("accKeyboardShortcut")
+atta_properties.attribute("columnExtent", interface="IAccessibleTableCell")
+atta_properties.attribute("rowExtent", interface="IAccessibleTableCell")
@@ -10,12 +10,108 @@
 # For license information, see:
 # https://www.w3.org/Consortium/Legal/2008/04-testsuite-copyright.html
 
+import itertools
 import json
 import threading
 import time
 import traceback
+import zlib
 
+from urlparse import urlparse, parse_qs
 from BaseHTTPServer import BaseHTTPRequestHandler
+from win_atta_event_stream import event_stream
+from win_atta_metrics import metrics
+
+class AttaResponseWriter(object):
+    """Writes a response body for a request handler. When the client accepts
+    gzip or deflate, headers are held back until the body reaches the
+    compression threshold, so small responses are sent as they are and large
+    ones are compressed as they are written. Once a streamed response is
+    compressed, the compressor is flushed after each write so the client can
+    decode every chunk as soon as it arrives."""
+
+    _wbits = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+    def __init__(self, handler, status_code, message, methods=("POST",), content_type="application/json",
+                 streamed=False):
+        self._handler = handler
+        self._status = status_code, message
+        self._methods = methods
+        self._content_type = content_type
+        self._encoding = handler.get_accepted_encoding()
+        self._compressor = None
+        self._compress_time = 0.0
+        self._pending = []
+        self._pending_size = 0
+        self._headers_sent = False
+        self._streamed = streamed
+        self.size = 0
+        self.sent = 0
+
+        if self._encoding is None:
+            self._send_headers()
+
+    def _send_headers(self, encoding=None):
+        handler = self._handler
+        handler.send_response(*self._status)
+        if encoding:
+            handler.send_header("Content-Encoding", encoding)
+            handler.send_header("Vary", "Accept-Encoding")
+        handler.send_header("Content-Type", self._content_type)
+        handler.add_headers(self._methods)
+        self._headers_sent = True
+
+    def _write(self, data):
+        if not data:
+            return
+
+        start_time = time.time()
+        self._handler.wfile.write(data)
+        self.sent += len(data)
+        metrics.add_phase("write", time.time() - start_time)
+
+    def _start_compression(self):
+        self._send_headers(self._encoding)
+        self._compressor = zlib.compressobj(self._handler._compress_level,
+                                            zlib.DEFLATED,
+                                            self._wbits[self._encoding])
+
+    def _compress(self, data=None):
+        start_time = time.time()
+        if data is None:
+            data = self._compressor.flush()
+        else:
+            data = self._compressor.compress(data)
+            if self._streamed:
+                data += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._compress_time += time.time() - start_time
+        return data
+
+    def write(self, data):
+        self.size += len(data)
+        if self._compressor is not None:
+            self._write(self._compress(data))
+        elif self._headers_sent:
+            self._write(data)
+        else:
+            self._pending.append(data)
+            self._pending_size += len(data)
+            if self._pending_size >= self._handler._compress_threshold:
+                self._start_compression()
+                data = "".join(self._pending)
+                self._pending = []
+                self._write(self._compress(data))
+
+    def close(self):
+        if self._compressor is not None:
+            self._write(self._compress())
+            metrics.add_phase("compress", self._compress_time)
+            self._handler._record_compression(self._encoding, self.size, self.sent, self._compress_time)
+        elif not self._headers_sent:
+            self._send_headers()
+            self._write("".join(self._pending))
+            self._pending = []
+
 
 class AttaRequestHandler(BaseHTTPRequestHandler):
     """Optional request handler for python27 Accessible Technology Test Adapters."""
@@ -23,11 +119,52 @@ class AttaRequestHandler(BaseHTTPRequestHandler):
     _atta = None
     _timeout = 5
     _running_tests = False
+    _stream_keepalive = 15
+
+    # The ATTA's state is not safe to share, so requests are handled one at a
+    # time, except for the long-lived event streams, which only read events
+    _request_lock = threading.Lock()
+    _concurrent_endpoints = frozenset(["events"])
+
+    # Responses are encoded compactly unless pretty output is requested for debugging
+    _pretty_json = False
+    _compact_encoder = json.JSONEncoder(separators=(",", ":"))
+    _pretty_encoder = json.JSONEncoder(indent=4, sort_keys=True)
+    _json_stats = {"responses": 0, "bytes": 0, "encode_time": 0.0}
+
+    # Bodies smaller than the threshold are never compressed
+    _compress_threshold = 4096
+    _compress_level = 6
+
+    # Last path segment -> (allowed methods, handler method name)
+    _routes = {
+        "start": (("POST",), "start_test_run"),
+        "startlisten": (("POST",), "start_listen"),
+        "test": (("POST",), "run_tests"),
+        "stoplisten": (("POST",), "stop_listen"),
+        "end": (("POST",), "end_test_run"),
+        "metrics": (("GET", "POST"), "send_metrics"),
+        "health": (("GET", "POST"), "send_health"),
+        "events": (("GET",), "stream_events"),
+        "results": (("GET",), "send_results"),
+    }
+
+    _result_content_types = {"json": "application/json",
+                             "ndjson": "application/x-ndjson",
+                             "csv": "text/csv"}
 
     @classmethod
     def set_atta(cls, atta):
         cls._atta = atta
 
+    @classmethod
+    def set_pretty_json(cls, pretty):
+        cls._pretty_json = bool(pretty)
+
+    @classmethod
+    def get_json_stats(cls):
+        return dict(cls._json_stats)
+
     @classmethod
     def is_running_tests(cls):
         return cls._running_tests
@@ -39,50 +176,83 @@ class AttaRequestHandler(BaseHTTPRequestHandler):
         self.dispatch()
 
     def dispatch(self):
-        if len(self.path):
-
-            if self.path.endswith("start"):
-                self.start_test_run()
-            elif self.path.endswith("startlisten"):
-                self.start_listen()
-            elif self.path.endswith("test"):
-                self.run_tests()
-            elif self.path.endswith("stoplisten"):
-                self.stop_listen()
-            elif self.path.endswith("end"):
-                self.end_test_run()
+        endpoint = urlparse(self.path).path.rstrip("/").rsplit("/", 1)[-1]
+
+        route = self._routes.get(endpoint)
+        if route is None:
+            metrics.increment("requests_not_found")
+            self.send_error(404, "UNHANDLED PATH: %s" % self.path)
+            return
+
+        methods, handler = route
+        if self.command not in methods:
+            metrics.increment("requests_method_not_allowed")
+            self.send_error(405, "METHOD %s NOT ALLOWED FOR: %s" % (self.command, self.path), methods)
+            return
+
+        if endpoint in self._concurrent_endpoints:
+            self._handle(endpoint, handler)
         else:
-            self.send_error(400, "UNHANDLED PATH: %s" % self.path)
+            with self._request_lock:
+                self._handle(endpoint, handler)
 
-    def send_error(self, code, message=None):
+    def _handle(self, endpoint, handler):
+
+        start_time = time.time()
+        metrics.begin_request(endpoint)
+        try:
+            getattr(self, handler)()
+        finally:
+            metrics.end_request()
+        metrics.observe_request(endpoint, (time.time() - start_time) * 1000)
+
+    def send_error(self, code, message=None, methods=("POST",)):
 
         if message is None:
             message = "Error: bad request"
 
         self.send_response(code, message)
         self.send_header("Content-Type", "text/plain")
-        self.add_headers()
+        self.add_headers(methods)
         # JRG
         # self.wfile.write(bytes("%s\n" % message, "utf-8"))
         self.wfile.write(bytes("%s\n" % message))
 
-    @staticmethod
-    def dump_json(obj):
+    @classmethod
+    def dump_json(cls, obj):
+
+        if cls._pretty_json:
+            return cls._pretty_encoder.encode(obj)
+
+        return cls._compact_encoder.encode(obj)
 
-        return json.dumps(obj, indent=4, sort_keys=True)
+    def _record_json(self, size, encode_time):
 
-    def add_aria_headers(self):
+        stats = AttaRequestHandler._json_stats
+        stats["responses"] += 1
+        stats["bytes"] += size
+        stats["encode_time"] += encode_time
+
+        if self._atta is not None:
+            msg = "[RH][json] %d bytes encoded in %.2f ms" % (size, encode_time * 1000)
+            self._atta.log_message(msg, self._atta.LOG_DEBUG)
+
+    def add_aria_headers(self, methods=("POST",)):
 
         self.send_header("Content-Type", "application/json")
-        self.add_headers()
+        self.add_headers(methods)
 
-    def add_headers(self):
+    def add_headers(self, methods=("POST",)):
 
+        allow = ", ".join(methods)
         self.send_header("Access-Control-Allow-Headers", "Content-Type")
-        self.send_header("Access-Control-Allow-Methods", "POST")
+        self.send_header("Access-Control-Allow-Methods", allow)
         self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Expose-Headers", "Allow, Content-Type")
-        self.send_header("Allow", "POST")
+        self.send_header("Access-Control-Expose-Headers", "Allow, Content-Type, Server-Timing")
+        self.send_header("Allow", allow)
+        timer = metrics.current_request()
+        if timer is not None and timer.phases:
+            self.send_header("Server-Timing", timer.server_timing())
         self.end_headers()
 
     def get_params(self, *params):
@@ -91,6 +261,7 @@ class AttaRequestHandler(BaseHTTPRequestHandler):
         response = {}
         errors = []
 
+        start_time = time.time()
         try:
             length = self.headers.__getitem__("content-length")
             content = self.rfile.read(int(length))
@@ -98,6 +269,7 @@ class AttaRequestHandler(BaseHTTPRequestHandler):
         except:
             error = traceback.format_exc(limit=1, chain=False)
             errors.append(error)
+        metrics.add_phase("parse", time.time() - start_time)
 
         for param in params:
             value = submission.get(param)
@@ -115,20 +287,107 @@ class AttaRequestHandler(BaseHTTPRequestHandler):
     def log_message(self, format, *args):
         self._atta.log_message(format % args, self._atta.LOG_DEBUG)
 
-    def _send_response(self, response, status_code=200):
+    def get_accepted_encoding(self):
+        """Returns "gzip" or "deflate" if the client accepts it, otherwise None."""
+
+        accepted = {}
+        for item in (self.headers.get("accept-encoding") or "").split(","):
+            parts = item.split(";")
+            name = parts[0].strip().lower()
+            quality = 1.0
+            for part in parts[1:]:
+                part = part.strip()
+                if part.startswith("q="):
+                    try:
+                        quality = float(part[2:])
+                    except ValueError:
+                        quality = 0.0
+            if name:
+                accepted[name] = quality
+
+        for encoding in ("gzip", "deflate"):
+            if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+                return encoding
+
+        return None
+
+    def _record_compression(self, encoding, size, sent, compress_time):
+
+        metrics.increment("compressed_responses")
+        metrics.increment("compression_bytes_in", size)
+        metrics.increment("compression_bytes_out", sent)
+        metrics.increment("compression_bytes_saved", size - sent)
+
+        if self._atta is not None:
+            msg = "[RH][%s] %d -> %d bytes in %.2f ms" % (encoding, size, sent, compress_time * 1000)
+            self._atta.log_message(msg, self._atta.LOG_DEBUG)
+
+    def _send_response(self, response, status_code=200, methods=("POST",)):
 
         if response.get("statusText") is None:
             response["statusText"] = ""
 
         message = response.get("statusText")
-        self.send_response(status_code, message)
-        self.add_aria_headers()
+        start_time = time.time()
         dump = self.dump_json(response)
+        encode_time = time.time() - start_time
+        metrics.add_phase("encode", encode_time)
+        self._record_json(len(dump), encode_time)
         try:
 #            self.wfile.write(bytes(dump, "utf-8"))
-            self.wfile.write(dump)
+            writer = AttaResponseWriter(self, status_code, message, methods)
+            writer.write(dump)
+            writer.close()
         except Exception as error:
-            self._atta.log_message('[RH][_send_response]' + error, self._atta.LOG_ERROR)
+            self._atta.log_message('[RH][_send_response]' + str(error), self._atta.LOG_ERROR)
+
+    def _send_streamed_response(self, response, results, status_code=200):
+        """Sends response with a "results" list, writing each result to wfile
+        as soon as it is produced by the results iterable."""
+
+        if self._pretty_json:
+            response["results"] = list(results)
+            self._send_response(response, status_code)
+            return
+
+        if response.get("statusText") is None:
+            response["statusText"] = ""
+
+        encode = self._compact_encoder.encode
+        size = 0
+        encode_time = 0.0
+        writer = None
+        chunk = ""
+        try:
+            writer = AttaResponseWriter(self, status_code, response.get("statusText"), streamed=True)
+            start_time = time.time()
+            chunk = encode(response)[:-1]
+            chunk += ',"results":[' if len(chunk) > 1 else '"results":['
+            encode_time += time.time() - start_time
+            for index, result in enumerate(results):
+                writer.write(chunk)
+                size += len(chunk)
+                chunk = ""
+                start_time = time.time()
+                chunk = encode(result)
+                if index:
+                    chunk = "," + chunk
+                encode_time += time.time() - start_time
+        except Exception as error:
+            self._atta.log_message('[RH][_send_streamed_response]' + str(error), self._atta.LOG_ERROR)
+        finally:
+            # Headers may already be sent, so end the document whatever happened
+            if writer is not None:
+                try:
+                    chunk += "]}"
+                    writer.write(chunk)
+                    size += len(chunk)
+                    writer.close()
+                except Exception as error:
+                    self._atta.log_message('[RH][_send_streamed_response]' + str(error), self._atta.LOG_ERROR)
+
+        metrics.add_phase("encode", encode_time)
+        self._record_json(size, encode_time)
 
     def _wait(self, start_time, method, response={}):
 
@@ -186,6 +445,8 @@ class AttaRequestHandler(BaseHTTPRequestHandler):
         while self._wait(start_time, self._atta.is_ready, response):
             time.sleep(0.5)
 
+        metrics.add_phase("ready", time.time() - start_time)
+        metrics.observe("document_ready", (time.time() - start_time) * 1000)
         response["status"] = "READY"
         self._send_response(response)
         self._wait_for_run_request()
@@ -213,15 +474,21 @@ class AttaRequestHandler(BaseHTTPRequestHandler):
         AttaRequestHandler._running_tests = True
         params = self.get_params("title", "id", "data")
         response = {}
+        results = iter([])
         if self._atta is not None:
 
-            result = self._atta.run_tests(params.get("id"), params.get("data", {}))
-            response.update(result)
+            head, results = self._atta.iter_tests(params.get("id"), params.get("data", {}))
+            response.update(head)
 
-        if not response.get("results"):
+        # Run the first assertion up front so the status line reflects empty results
+        first = next(results, None)
+        if first is None:
             response["statusText"] = params.get("error")
+            results = []
+        else:
+            results = itertools.chain([first], results)
 
-        self._send_response(response)
+        self._send_streamed_response(response, results)
 
     def stop_listen(self):
         self._atta.log_message('[RH][stop_listen]', self._atta.LOG_DEBUG)
@@ -239,3 +506,112 @@ class AttaRequestHandler(BaseHTTPRequestHandler):
         response = {"status": "DONE"}
         self._send_response(response)
         AttaRequestHandler._running_tests = False
+
+    def send_metrics(self):
+
+        if self._atta is not None:
+            response = self._atta.get_metrics()
+        else:
+            response = metrics.snapshot()
+
+        response["json"] = self.get_json_stats()
+        response["status"] = "OK"
+        self._send_response(response, methods=self._routes["metrics"][0])
+
+    def send_health(self):
+
+        response = {"status": "OK",
+                    "uptime": round(metrics.uptime(), 3),
+                    "runningTests": self.is_running_tests()}
+
+        if self._atta is not None:
+            response["enabled"] = self._atta.is_enabled()
+            response["ready"] = bool(self._atta.is_ready())
+        else:
+            response["status"] = "ERROR"
+            response["statusText"] = "ATTA NOT FOUND"
+
+        self._send_response(response, methods=self._routes["health"][0])
+
+    def send_results(self):
+        """Sends the results of the assertions run so far as a JSON array, as
+        newline delimited JSON with ?format=ndjson or as CSV with ?format=csv,
+        keeping only those matching the status, file and test query parameters.
+        With ?group=status or ?group=file, sends the number of results in each
+        status, or each status and file, instead."""
+
+        methods = self._routes["results"][0]
+        if self._atta is None:
+            self._send_response({"status": "ERROR", "statusText": "ATTA NOT FOUND"}, methods=methods)
+            return
+
+        query = parse_qs(urlparse(self.path).query)
+        store = self._atta.get_results()
+        group = query.get("group", [None])[0]
+        if group:
+            self._send_response({"status": "OK", "counts": store.get_counts(group)}, methods=methods)
+            return
+
+        format = query.get("format", ["json"])[0]
+        if format not in store.FORMATS:
+            self.send_error(400, "UNKNOWN FORMAT: %s" % format, methods)
+            return
+
+        filters = dict((name, query[name][0].decode("utf-8"))
+                       for name in ("status", "file", "test") if name in query)
+        try:
+            writer = AttaResponseWriter(self, 200, "", methods, self._result_content_types[format])
+            store.export(writer, format, **filters)
+            writer.close()
+        except Exception as error:
+            self._atta.log_message('[RH][send_results]' + str(error), self._atta.LOG_ERROR)
+
+    def stream_events(self):
+        """Streams accessibility events as server-sent events, or as newline
+        delimited JSON with ?format=ndjson, until the client disconnects.
+        Events can be filtered with the type, id and document query parameters,
+        each of which accepts a comma separated list."""
+
+        query = parse_qs(urlparse(self.path).query)
+
+        def _values(name):
+            values = []
+            for value in query.get(name, []):
+                values.extend(v for v in value.split(",") if v)
+            return values
+
+        ndjson = query.get("format", ["sse"])[0] == "ndjson"
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson" if ndjson else "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.add_headers(self._routes["events"][0])
+
+        encode = self._compact_encoder.encode
+        filters = {"types": _values("type"), "ids": _values("id"), "documents": _values("document")}
+        if self._atta is not None:
+            subscriber = self._atta.open_event_stream(**filters)
+        else:
+            subscriber = event_stream.subscribe(**filters)
+        try:
+            while True:
+                event = subscriber.get(self._stream_keepalive)
+                if event is None:
+                    # Keeps idle connections open and detects closed ones
+                    if ndjson:
+                        chunk = "\n"
+                    else:
+                        chunk = ": keepalive dropped=%d\n\n" % subscriber.dropped
+                elif ndjson:
+                    chunk = encode(event) + "\n"
+                else:
+                    chunk = "event: %s\ndata: %s\n\n" % (event.get("type"), encode(event))
+                self.wfile.write(chunk)
+                self.wfile.flush()
+        except Exception as error:
+            self._atta.log_message('[RH][stream_events] closed: ' + str(error), self._atta.LOG_DEBUG)
+        finally:
+            if self._atta is not None:
+                self._atta.close_event_stream(subscriber)
+            else:
+                event_stream.unsubscribe(subscriber)
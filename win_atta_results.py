@@ -0,0 +1,205 @@
+#!/usr/bin/env python27
+#
+# win_atta_results
+# Column-oriented store of assertion results for Accessible Technology Test Adapters
+#
+# Developed by Jon Gunderson, Mihir Kumar and Bei Zhang
+# Copyright (c) 2017 University of Illinois
+# Based on the ATTAs developed by Joanmarie Diggs (@joanmarie)
+#
+# For license information, see:
+# https://www.w3.org/Consortium/Legal/2008/04-testsuite-copyright.html
+
+import csv
+import json
+import threading
+
+from array import array
+
+
+class AttaStringTable(object):
+    """Interns strings as small ints so each distinct value is stored once."""
+
+    def __init__(self):
+        self._ids = {}
+        self._values = []
+
+    def __len__(self):
+        return len(self._values)
+
+    def intern(self, value):
+        index = self._ids.get(value)
+        if index is None:
+            index = self._ids[value] = len(self._values)
+            self._values.append(value)
+        return index
+
+    def find(self, value):
+        """Returns the int for value, or None if it was never interned."""
+
+        return self._ids.get(value)
+
+    def get(self, index):
+        return self._values[index]
+
+
+class AttaResultStore(object):
+    """Append-only record of assertion results, one int column per field.
+
+    Tests, files, assertions and statuses are interned, so a row costs a few
+    bytes however long its assertion. At most max_rows rows are kept: when
+    full, the older half is dropped and the strings only they used with it.
+    Counts by status and file are kept as rows are added and survive the
+    trimming, but those of files left without rows are rolled up by status
+    under TRIMMED_FILE, so the counts stay bounded too."""
+
+    COLUMNS = ("test", "file", "assertion", "status")
+    FORMATS = ("json", "ndjson", "csv")
+
+    TRIMMED_FILE = "(trimmed)"
+
+    def __init__(self, max_rows=200000):
+        self._lock = threading.Lock()
+        self._max_rows = max_rows
+        self._tables = dict((column, AttaStringTable()) for column in self.COLUMNS)
+        self._columns = dict((column, array("i")) for column in self.COLUMNS)
+        self._counts = {}
+        # Rows are numbered from the first one ever added, including those trimmed
+        self._first = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._columns["status"])
+
+    @property
+    def end(self):
+        """The number of the row the next add() will create."""
+
+        return self._first + len(self)
+
+    def add(self, test, test_file, assertion, status):
+        row = {"test": test, "file": test_file, "assertion": assertion, "status": status}
+        with self._lock:
+            if len(self) >= self._max_rows:
+                self._trim()
+
+            for column in self.COLUMNS:
+                self._columns[column].append(self._tables[column].intern(row[column]))
+
+            key = status, test_file
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def _trim(self):
+        """Drops the older half of the rows, interning the others into new
+        string tables so strings used only by dropped rows go too. Snapshots
+        keep the tables and columns they were taken with."""
+
+        count = len(self) // 2
+        tables = dict((column, AttaStringTable()) for column in self.COLUMNS)
+        columns = {}
+        for column in self.COLUMNS:
+            table, old_table = tables[column], self._tables[column]
+            columns[column] = array("i", (table.intern(old_table.get(index))
+                                          for index in self._columns[column][count:]))
+
+        counts = {}
+        for (status, test_file), total in self._counts.items():
+            if tables["file"].find(test_file) is None:
+                test_file = self.TRIMMED_FILE
+            counts[status, test_file] = counts.get((status, test_file), 0) + total
+
+        self._tables = tables
+        self._columns = columns
+        self._counts = counts
+        self._first += count
+        self.dropped += count
+
+    def get_counts(self, group="file"):
+        """Returns the number of results for each status, or with group="file"
+        for each status and file, including rows that were trimmed. Files
+        whose rows were all trimmed are counted under TRIMMED_FILE."""
+
+        with self._lock:
+            counts = dict(self._counts)
+
+        grouped = {}
+        for (status, test_file), count in counts.items():
+            if group == "file":
+                grouped.setdefault(status, {})[test_file] = count
+            else:
+                grouped[status] = grouped.get(status, 0) + count
+        return grouped
+
+    def _snapshot(self, start):
+        """Returns the number following the last row, with the columns from row
+        start on and the string tables, consistent with one another."""
+
+        with self._lock:
+            offset = max(start - self._first, 0)
+            columns = dict((column, self._columns[column][offset:]) for column in self.COLUMNS)
+            return self.end, columns, dict(self._tables)
+
+    def iter_rows(self, start=0, **filters):
+        """Yields the rows numbered start and later as dicts, keeping only rows
+        whose fields equal the values given as keyword arguments."""
+
+        end, columns, tables = self._snapshot(start)
+        return self._iter_rows(columns, tables, filters)
+
+    def _iter_rows(self, columns, tables, filters):
+        wanted = []
+        for column, value in filters.items():
+            index = tables[column].find(value)
+            if index is None:
+                return
+            wanted.append((columns[column], index))
+
+        fields = [(column, columns[column], tables[column]) for column in self.COLUMNS]
+        for position in xrange(len(columns["status"])):
+            if all(values[position] == index for values, index in wanted):
+                yield dict((column, table.get(values[position])) for column, values, table in fields)
+
+    def export(self, stream, format="json", start=0, header=True, **filters):
+        """Writes the rows numbered start and later to stream, one at a time,
+        as a JSON array, newline delimited JSON or CSV. Returns the number of
+        the row following the last one written."""
+
+        end, columns, tables = self._snapshot(start)
+        rows = self._iter_rows(columns, tables, filters)
+        if format == "csv":
+            writer = csv.writer(stream)
+            if header:
+                writer.writerow(self.COLUMNS)
+            for row in rows:
+                writer.writerow([_encode(row[column]) for column in self.COLUMNS])
+        elif format == "ndjson":
+            for row in rows:
+                stream.write(json.dumps(row) + "\n")
+        else:
+            separator = "["
+            for row in rows:
+                stream.write(separator + json.dumps(row))
+                separator = ",\n"
+            stream.write("[]" if separator == "[" else "]")
+
+        return end
+
+    def clear(self):
+        with self._lock:
+            self._first = self.end
+            self._tables = dict((column, AttaStringTable()) for column in self.COLUMNS)
+            self._columns = dict((column, array("i")) for column in self.COLUMNS)
+            self._counts = {}
+
+    def get_stats(self):
+        return {"rows": self.end,
+                "stored": len(self),
+                "dropped": self.dropped,
+                "assertions": len(self._tables["assertion"]),
+                "byStatus": self.get_counts(group="status")}
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    return value
@@ -0,0 +1,122 @@
+#!/usr/bin/env python27
+#
+# win_atta_workers
+# Worker threads for concurrent property fetches in Accessible Technology Test Adapters
+#
+# Developed by Jon Gunderson, Mihir Kumar and Bei Zhang
+# Copyright (c) 2017 University of Illinois
+# Based on the ATTAs developed by Joanmarie Diggs (@joanmarie)
+#
+# For license information, see:
+# https://www.w3.org/Consortium/Legal/2008/04-testsuite-copyright.html
+
+import Queue
+import threading
+import time
+
+
+class AttaWorkerPool(object):
+    """A fixed set of daemon threads shared by all requests. initializer and
+    finalizer run once on each worker, e.g. to enter and leave a COM apartment.
+
+    Work is handed to the workers as plain values, never COM pointers, so each
+    worker fetches what it needs through its own apartment."""
+
+    def __init__(self, size, initializer=None, finalizer=None):
+        self.size = size
+        self._tasks = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stats = {"maps": 0, "tasks": 0, "initFailures": 0, "busyTime": 0.0}
+
+        for index in range(size):
+            thread = threading.Thread(target=self._work,
+                                      args=(initializer, finalizer),
+                                      name="AttaWorker-%d" % index)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _work(self, initializer, finalizer):
+        if initializer is not None:
+            try:
+                initializer()
+            except Exception:
+                # Keep serving so callers never wait on a worker that died
+                self._count("initFailures")
+
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    break
+
+                func, item, results, index, done = task
+                start_time = time.time()
+                try:
+                    results[index] = func(item), None
+                except Exception as error:
+                    results[index] = None, error
+                self._count("busyTime", time.time() - start_time)
+                done.put(index)
+        finally:
+            if finalizer is not None:
+                try:
+                    finalizer()
+                except Exception:
+                    pass
+
+    def map(self, func, items):
+        """Returns [func(item) for item in items], calling func on the workers.
+        Results are in the order of items whatever order they finish in; if
+        any call raised, the exception of the first such item is raised."""
+
+        items = list(items)
+        results = [None] * len(items)
+        done = Queue.Queue()
+        for index, item in enumerate(items):
+            self._tasks.put((func, item, results, index, done))
+
+        for _ in items:
+            done.get()
+
+        self._count("maps")
+        self._count("tasks", len(items))
+        for value, error in results:
+            if error is not None:
+                raise error
+
+        return [value for value, error in results]
+
+    def close(self, timeout=1.0):
+        for _ in self._threads:
+            self._tasks.put(None)
+
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["size"] = self.size
+        return stats
+
+
+def is_worth_splitting(costs, setup_cost, workers):
+    """Returns True if tasks of the given costs, e.g. COM calls, should finish
+    sooner on that many workers, each task paying setup_cost there first,
+    than one after another on a single thread. The workers are assumed to
+    take the costliest tasks first, each going to the least loaded one."""
+
+    if len(costs) < 2 or workers < 2:
+        return False
+
+    loads = [0] * min(workers, len(costs))
+    for cost in sorted(costs, reverse=True):
+        loads[loads.index(min(loads))] += setup_cost + cost
+    return max(loads) < sum(costs)